@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def connect_sqlite(db_path):
+    directory = os.path.dirname(db_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    # WAL lets several worker processes read while one of them writes
+    connection = sqlite3.connect(db_path, timeout=5.0)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class MemoryLRU:
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, size, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, expires_at):
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, size, expires_at)
+            self.total_bytes += size
+
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+
+class SQLiteStore:
+    PRUNE_INTERVAL = 256
+    # last_access only feeds LRU pruning; refreshing it at most once a minute keeps cache
+    # reads from taking the WAL write lock on every hit
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, db_path, max_entries=100000, on_remove=None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.on_remove = on_remove
+        self.evictions = 0
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        self.connection().execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                file_hash TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.connection().execute(
+            'CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_access ON analysis_cache (last_access)'
+        )
+        self.connection().commit()
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = connect_sqlite(self.db_path)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        now = time.time()
+        connection = self.connection()
+        row = connection.execute(
+            'SELECT payload, expires_at, last_access FROM analysis_cache WHERE file_hash = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, expires_at, last_access = row
+        if expires_at <= now:
+            self.delete(key)
+            return None
+
+        if now - last_access > self.ACCESS_RESOLUTION:
+            connection.execute('UPDATE analysis_cache SET last_access = ? WHERE file_hash = ?', (now, key))
+            connection.commit()
+        return payload, expires_at
+
+    def set(self, key, payload, expires_at):
+        now = time.time()
+        connection = self.connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO analysis_cache (file_hash, payload, created_at, expires_at, last_access) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, payload, now, expires_at, now)
+        )
+        connection.commit()
+
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.PRUNE_INTERVAL == 0
+        if should_prune:
+            self.prune()
+
+    def delete(self, key):
+        connection = self.connection()
+        connection.execute('DELETE FROM analysis_cache WHERE file_hash = ?', (key,))
+        connection.commit()
+
+    def clear(self):
+        connection = self.connection()
+        connection.execute('DELETE FROM analysis_cache')
+        connection.commit()
+
+    def prune(self):
+        now = time.time()
+        connection = self.connection()
+        removed = [row[0] for row in connection.execute(
+            'SELECT file_hash FROM analysis_cache WHERE expires_at <= ?', (now,)
+        )]
+        removed += [row[0] for row in connection.execute(
+            'SELECT file_hash FROM analysis_cache WHERE expires_at > ? ORDER BY last_access DESC LIMIT -1 OFFSET ?',
+            (now, self.max_entries)
+        )]
+        connection.executemany('DELETE FROM analysis_cache WHERE file_hash = ?', [(key,) for key in removed])
+        connection.commit()
+        self.evictions += len(removed)
+        if removed and self.on_remove is not None:
+            self.on_remove(removed)
+
+    def count(self):
+        return self.connection().execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+
+
+class AnalysisCache:
+    def __init__(self, db_path=None, ttl=7 * 24 * 3600, memory_max_entries=1024,
+                 memory_max_bytes=8 * 1024 * 1024, disk_max_entries=100000, memory_ttl=60, on_remove=None):
+        # on_remove(file_hashes) is told about invalidated and pruned entries
+        self.ttl = ttl
+        self.memory_ttl = memory_ttl
+        self.on_remove = on_remove
+        self.memory = MemoryLRU(memory_max_entries, memory_max_bytes)
+        self.disk = SQLiteStore(db_path, disk_max_entries, on_remove) if db_path else None
+        self.stats_counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'invalidations': 0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def get(self, file_hash):
+        product_info, tier = self._lookup(file_hash)
+        self._count(f'{tier}_hits' if tier else 'misses')
+        return product_info
+
+    def peek(self, file_hash):
+        # Same lookup without touching the hit/miss counters, for speculative probes
+        return self._lookup(file_hash)[0]
+
+    def _lookup(self, file_hash):
+        product_info = self.memory.get(file_hash)
+        if product_info is not None:
+            return product_info, 'memory'
+
+        if self.disk is not None:
+            row = self.disk.get(file_hash)
+            if row is not None:
+                payload, expires_at = row
+                product_info = json.loads(payload)
+                self.memory.set(file_hash, product_info, len(payload), self.memory_expiry(expires_at))
+                return product_info, 'disk'
+        return None, None
+
+    def set(self, file_hash, product_info):
+        payload = json.dumps(product_info, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+
+        self.memory.set(file_hash, product_info, len(payload), self.memory_expiry(expires_at))
+        if self.disk is not None:
+            self.disk.set(file_hash, payload, expires_at)
+        self._count('sets')
+
+    def memory_expiry(self, expires_at):
+        # Invalidations only reach the memory tier of the process that handled them, so with a
+        # shared disk tier other workers re-read entries after memory_ttl at the latest
+        if self.disk is None:
+            return expires_at
+        return min(expires_at, time.time() + self.memory_ttl)
+
+    def invalidate(self, file_hash):
+        self.memory.delete(file_hash)
+        if self.disk is not None:
+            self.disk.delete(file_hash)
+        if self.on_remove is not None:
+            self.on_remove([file_hash])
+        self._count('invalidations')
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats_counters)
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['memory_entries'] = len(self.memory)
+        stats['memory_bytes'] = self.memory.total_bytes
+        stats['memory_evictions'] = self.memory.evictions
+        if self.disk is not None:
+            stats['disk_entries'] = self.disk.count()
+            stats['disk_evictions'] = self.disk.evictions
+        return stats
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats_counters[name] += 1
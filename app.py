@@ -1,54 +1,338 @@
 import os
 import json
+import time
+import queue
+import atexit
 import logging
-from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import Flask, Response, g, request, jsonify, render_template, send_file
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 import google.generativeai as genai
 from dotenv import load_dotenv
 import secrets
 import hashlib
-import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from analysis_cache import AnalysisCache, MemoryLRU
+from image_fingerprint import FingerprintIndex, compute_dhash
+from image_preprocessing import ImagePreprocessor
+from upload_storage import IncomingUpload, UploadStorage, MIME_EXTENSIONS
+from upload_lifecycle import ThumbnailCache, UploadJanitor
+from search_jobs import QueueFullError, SearchJobManager
+from gemini_client import (
+    GeminiClient, GeminiError, GeminiTimeoutError, RETRYABLE_STATUS_CODES, error_status_code
+)
+from marketplaces import MarketplaceRegistry
+from marketplace_probe import MarketplaceProber
+from json_provider import create_json_provider
+from streaming_json import IncrementalObjectParser, strip_code_fences
+from metrics import MetricsRegistry, Tracer
 
 load_dotenv()
 
+FALLBACK_PRODUCT_INFO = {
+    "product_name": "Resimdeki ürün",
+    "product_type": "Genel",
+    "features": ["Resim tabanlı ürün"],
+    "brand": "Bilinmiyor",
+    "color": "Çeşitli",
+    "style": "Standart",
+    "material": "Bilinmiyor"
+}
+
+PRODUCT_INFO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "product_name": {"type": "string"},
+        "product_type": {"type": "string"},
+        "features": {"type": "array", "items": {"type": "string"}},
+        "brand": {"type": "string"},
+        "color": {"type": "string"},
+        "style": {"type": "string"},
+        "material": {"type": "string"}
+    },
+    "required": ["product_name"]
+}
+
+ANALYSIS_PROMPT = """
+Bu resmi analiz et ve görünen ana ürünü veya nesneyi tanımla. 
+Türkçe olarak detaylı bir açıklama sağla:
+1. Ürün adı ve türü
+2. Ana özellikler ve karakteristikler
+3. Marka (tanımlanabilirse)
+4. Renk ve stil
+5. Malzeme (uygulanabilirse)
+
+Yanıtınızı bu alanlarla ve bu sırayla, product_name ilk alan olacak şekilde JSON formatında verin:
+{
+    "product_name": "ürün_adı",
+    "product_type": "kategori",
+    "features": ["özellik1", "özellik2"],
+    "brand": "marka_adı",
+    "color": "renk_açıklaması",
+    "style": "stil_açıklaması",
+    "material": "malzeme_açıklaması"
+}
+
+Lütfen ürün adını Türkçe olarak verin.
+"""
+
 class ImageSearchApp:
     def __init__(self):
         self.app = Flask(__name__)
+        self.gemini_client = None
+        self.gemini_lock = threading.Lock()
         self.setup_config()
+        self.setup_storage()
         self.setup_logging()
+        self.setup_metrics()
+        self.setup_cache()
+        self.setup_preprocessing()
+        self.setup_jobs()
+        self.setup_marketplaces()
         self.setup_routes()
         self.setup_error_handlers()
         
     def setup_config(self):
         self.app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32))
         self.app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-        self.app.config['UPLOAD_FOLDER'] = 'uploads'
+        self.app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
+        self.app.config['LOG_FILE'] = os.getenv('LOG_FILE', 'app.log')
+        self.app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+        self.app.config['LOG_MAX_BYTES'] = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+        self.app.config['LOG_BACKUP_COUNT'] = int(os.getenv('LOG_BACKUP_COUNT', 5))
+        self.app.config['SLOW_REQUEST_SECONDS'] = float(os.getenv('SLOW_REQUEST_SECONDS', 2.0))
+        self.app.config['SLOW_TRACE_SAMPLE_RATE'] = float(os.getenv('SLOW_TRACE_SAMPLE_RATE', 0.1))
+        self.app.config['SLOW_TRACE_LIMIT'] = int(os.getenv('SLOW_TRACE_LIMIT', 100))
         self.app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+        self.app.config['UPLOAD_MAX_AGE'] = int(os.getenv('UPLOAD_MAX_AGE', 7 * 24 * 3600))
+        self.app.config['UPLOAD_MAX_BYTES'] = int(os.getenv('UPLOAD_MAX_BYTES', 2 * 1024 ** 3))
+        self.app.config['UPLOAD_JANITOR_INTERVAL'] = int(os.getenv('UPLOAD_JANITOR_INTERVAL', 300))
+        self.app.config['UPLOAD_ACCEL_REDIRECT_PREFIX'] = os.getenv('UPLOAD_ACCEL_REDIRECT_PREFIX') or None
+        self.app.config['THUMBNAIL_SIZES'] = [int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,256,512').split(',')]
+        self.app.config['THUMBNAIL_QUALITY'] = int(os.getenv('THUMBNAIL_QUALITY', 80))
+        self.app.config['ANALYSIS_CACHE_PATH'] = os.getenv('ANALYSIS_CACHE_PATH', os.path.join('cache', 'analysis.sqlite3'))
+        self.app.config['ANALYSIS_CACHE_TTL'] = int(os.getenv('ANALYSIS_CACHE_TTL', 7 * 24 * 3600))
+        self.app.config['ANALYSIS_CACHE_MEMORY_ENTRIES'] = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', 1024))
+        self.app.config['ANALYSIS_CACHE_MEMORY_BYTES'] = int(os.getenv('ANALYSIS_CACHE_MEMORY_BYTES', 8 * 1024 * 1024))
+        self.app.config['ANALYSIS_CACHE_DISK_ENTRIES'] = int(os.getenv('ANALYSIS_CACHE_DISK_ENTRIES', 100000))
+        self.app.config['ANALYSIS_CACHE_MEMORY_TTL'] = int(os.getenv('ANALYSIS_CACHE_MEMORY_TTL', 60))
+        self.app.config['NEAR_DUPLICATE_ENABLED'] = os.getenv('NEAR_DUPLICATE_ENABLED', 'true').lower() == 'true'
+        self.app.config['NEAR_DUPLICATE_MAX_DISTANCE'] = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 6))
+        self.app.config['IMAGE_MAX_EDGE'] = int(os.getenv('IMAGE_MAX_EDGE', 1024))
+        self.app.config['IMAGE_QUALITY'] = int(os.getenv('IMAGE_QUALITY', 85))
+        self.app.config['IMAGE_PREPROCESS_CACHE_ENTRIES'] = int(os.getenv('IMAGE_PREPROCESS_CACHE_ENTRIES', 64))
+        self.app.config['SEARCH_WORKERS'] = int(os.getenv('SEARCH_WORKERS', 4))
+        self.app.config['SEARCH_QUEUE_SIZE'] = int(os.getenv('SEARCH_QUEUE_SIZE', 32))
+        self.app.config['SEARCH_JOB_TTL'] = int(os.getenv('SEARCH_JOB_TTL', 600))
+        self.app.config['GEMINI_MODEL'] = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+        self.app.config['GEMINI_TIMEOUT'] = float(os.getenv('GEMINI_TIMEOUT', 30))
+        self.app.config['GEMINI_RATE_LIMIT'] = float(os.getenv('GEMINI_RATE_LIMIT', 5))
+        self.app.config['GEMINI_BURST'] = int(os.getenv('GEMINI_BURST', 10))
+        self.app.config['GEMINI_MAX_ATTEMPTS'] = int(os.getenv('GEMINI_MAX_ATTEMPTS', 3))
+        self.app.config['GEMINI_RETRY_BUDGET'] = float(os.getenv('GEMINI_RETRY_BUDGET', 0.2))
+        self.app.config['GEMINI_HEDGE'] = os.getenv('GEMINI_HEDGE', 'false').lower() == 'true'
+        self.app.config['GEMINI_BREAKER_THRESHOLD'] = int(os.getenv('GEMINI_BREAKER_THRESHOLD', 5))
+        self.app.config['GEMINI_BREAKER_RESET'] = float(os.getenv('GEMINI_BREAKER_RESET', 30))
+        self.app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', 100))
+        self.app.config['BATCH_PACK_SIZE'] = int(os.getenv('BATCH_PACK_SIZE', 4))
+        self.app.config['BATCH_CONCURRENCY'] = int(os.getenv('BATCH_CONCURRENCY', 4))
+        self.app.config['MARKETPLACES_CONFIG'] = os.getenv(
+            'MARKETPLACES_CONFIG', os.path.join(self.app.root_path, 'marketplaces.json')
+        )
+        self.app.config['MARKETPLACE_LOGO_FOLDER'] = os.getenv(
+            'MARKETPLACE_LOGO_FOLDER', os.path.join(self.app.root_path, 'marketplace_logos')
+        )
+        # Off by default: the count patterns are not verified against the live sites yet
+        self.app.config['MARKETPLACE_PROBE_ENABLED'] = os.getenv('MARKETPLACE_PROBE_ENABLED', 'false').lower() == 'true'
+        self.app.config['MARKETPLACE_PROBE_TIMEOUT'] = float(os.getenv('MARKETPLACE_PROBE_TIMEOUT', 2.5))
+        self.app.config['MARKETPLACE_PROBE_WORKERS'] = int(os.getenv('MARKETPLACE_PROBE_WORKERS', 16))
+        self.app.config['MARKETPLACE_PROBE_CACHE_TTL'] = int(os.getenv('MARKETPLACE_PROBE_CACHE_TTL', 900))
+        self.app.config['MARKETPLACE_PROBE_CACHE_ENTRIES'] = int(os.getenv('MARKETPLACE_PROBE_CACHE_ENTRIES', 5000))
+        self.app.config['MARKETPLACE_PROBE_BASE_URL'] = os.getenv('MARKETPLACE_PROBE_BASE_URL') or None
+        self.app.json = create_json_provider(self.app)
         
         if not os.path.exists(self.app.config['UPLOAD_FOLDER']):
             os.makedirs(self.app.config['UPLOAD_FOLDER'])
             
         CORS(self.app, origins=['http://localhost:3000', 'http://127.0.0.1:3000', 'http://localhost:5000', 'http://127.0.0.1:5000'])
         
+    def setup_storage(self):
+        self.storage = UploadStorage(self.app.config['UPLOAD_FOLDER'])
+        self.app.request_class = self.storage.request_class()
+        self.thumbnails = ThumbnailCache(
+            self.storage,
+            sizes=self.app.config['THUMBNAIL_SIZES'],
+            quality=self.app.config['THUMBNAIL_QUALITY']
+        )
+        self.upload_janitor = UploadJanitor(
+            self.storage,
+            max_age=self.app.config['UPLOAD_MAX_AGE'],
+            max_bytes=self.app.config['UPLOAD_MAX_BYTES'],
+            interval=self.app.config['UPLOAD_JANITOR_INTERVAL']
+        )
+        self.upload_janitor.start()
+        
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('app.log'),
-                logging.StreamHandler()
-            ]
+        # Request threads only enqueue records; a listener thread formats them and does the disk I/O
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        file_handler = RotatingFileHandler(
+            self.app.config['LOG_FILE'],
+            maxBytes=self.app.config['LOG_MAX_BYTES'],
+            backupCount=self.app.config['LOG_BACKUP_COUNT'],
+            encoding='utf-8'
         )
+        stream_handler = logging.StreamHandler()
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+        
+        log_queue = queue.Queue(-1)
+        self.log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+        self.log_listener.start()
+        atexit.register(self.log_listener.stop)
+        
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
+        logging.basicConfig(level=self.app.config['LOG_LEVEL'], handlers=[queue_handler])
         self.logger = logging.getLogger(__name__)
         
+    def setup_metrics(self):
+        self.metrics = MetricsRegistry()
+        self.tracer = Tracer(
+            self.metrics,
+            slow_threshold=self.app.config['SLOW_REQUEST_SECONDS'],
+            sample_rate=self.app.config['SLOW_TRACE_SAMPLE_RATE'],
+            max_traces=self.app.config['SLOW_TRACE_LIMIT']
+        )
+        self.request_seconds = self.metrics.histogram(
+            'imagesearch_http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method', 'status')
+        )
+        self.stream_first_result_seconds = self.metrics.histogram(
+            'imagesearch_stream_first_result_seconds', 'Time until a streamed search sends marketplace links',
+            ('cached',)
+        )
+        self.analysis_lookups = self.metrics.counter(
+            'imagesearch_analysis_cache_lookups_total', 'Analysis cache lookups by outcome', ('result',)
+        )
+        self.analysis_fallbacks = self.metrics.counter(
+            'imagesearch_analysis_fallbacks_total', 'Analyses that fell back to default product info', ('reason',)
+        )
+        self.gemini_errors = self.metrics.counter(
+            'imagesearch_gemini_errors_total', 'Failed Gemini calls by error type', ('error',)
+        )
+        self.metrics.gauge(
+            'imagesearch_search_queue_depth', 'Search jobs waiting for a worker',
+            lambda: self.search_jobs.stats()['queue_depth']
+        )
+        self.metrics.gauge(
+            'imagesearch_search_jobs_in_flight', 'Search jobs queued or running',
+            lambda: self.search_jobs.stats()['in_flight']
+        )
+        self.metrics.gauge(
+            'imagesearch_upload_bytes', 'Bytes in the upload folder at the last janitor sweep',
+            lambda: self.upload_janitor.stats()['bytes']
+        )
+        self.metrics.gauge(
+            'imagesearch_gemini_rate_limit', 'Current adaptive Gemini request rate per second',
+            lambda: self.gemini_client.limiter.rate if self.gemini_client else None
+        )
+        self.metrics.gauge(
+            'imagesearch_gemini_circuit_open', 'Whether the Gemini circuit breaker is open',
+            lambda: int(self.gemini_client.breaker.state == 'open') if self.gemini_client else None
+        )
+        self.app.before_request(self.start_request_trace)
+        self.app.after_request(self.finish_request_trace)
+        
+    def start_request_trace(self):
+        g.trace = self.tracer.start(request.endpoint or 'unmatched')
+        
+    def finish_request_trace(self, response):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+        
+        method = request.method
+        if response.is_streamed:
+            # after_request runs before a streamed body is generated, so these are timed when the
+            # server closes the response. Their generators keep their own traces for stage timings.
+            self.tracer.detach()
+            response.call_on_close(lambda: self.request_seconds.observe(
+                time.perf_counter() - trace.started, endpoint=trace.name, method=method, status=response.status_code
+            ))
+            return response
+        
+        duration = self.tracer.finish(trace, method=method, path=request.path, status=response.status_code)
+        self.request_seconds.observe(duration, endpoint=trace.name, method=method, status=response.status_code)
+        return response
+        
+    def setup_cache(self):
+        self.analysis_cache = AnalysisCache(
+            db_path=self.app.config['ANALYSIS_CACHE_PATH'] or None,
+            ttl=self.app.config['ANALYSIS_CACHE_TTL'],
+            memory_max_entries=self.app.config['ANALYSIS_CACHE_MEMORY_ENTRIES'],
+            memory_max_bytes=self.app.config['ANALYSIS_CACHE_MEMORY_BYTES'],
+            disk_max_entries=self.app.config['ANALYSIS_CACHE_DISK_ENTRIES'],
+            memory_ttl=self.app.config['ANALYSIS_CACHE_MEMORY_TTL'],
+            on_remove=self.forget_fingerprints
+        )
+        self.fingerprint_index = None
+        if self.app.config['NEAR_DUPLICATE_ENABLED']:
+            self.fingerprint_index = FingerprintIndex(db_path=self.app.config['ANALYSIS_CACHE_PATH'] or None)
+            self.logger.info(f"Loaded {len(self.fingerprint_index)} image fingerprints")
+        # Fingerprints of uploads that have not been analyzed yet; only analyzed images are indexed
+        self.pending_fingerprints = MemoryLRU(max_entries=4096, max_bytes=4096)
+        
+    def setup_preprocessing(self):
+        self.preprocessor = ImagePreprocessor(
+            max_edge=self.app.config['IMAGE_MAX_EDGE'],
+            jpeg_quality=self.app.config['IMAGE_QUALITY'],
+            cache_entries=self.app.config['IMAGE_PREPROCESS_CACHE_ENTRIES']
+        )
+        
+    def setup_jobs(self):
+        self.search_jobs = SearchJobManager(
+            worker_count=self.app.config['SEARCH_WORKERS'],
+            max_queue=self.app.config['SEARCH_QUEUE_SIZE'],
+            job_ttl=self.app.config['SEARCH_JOB_TTL']
+        )
+        self.batch_executor = ThreadPoolExecutor(
+            max_workers=self.app.config['BATCH_CONCURRENCY'],
+            thread_name_prefix='batch'
+        )
+        
+    def setup_marketplaces(self):
+        self.marketplaces = MarketplaceRegistry(
+            self.app.config['MARKETPLACES_CONFIG'],
+            self.app.config['MARKETPLACE_LOGO_FOLDER']
+        )
+        self.marketplace_prober = None
+        if self.app.config['MARKETPLACE_PROBE_ENABLED']:
+            self.marketplace_prober = MarketplaceProber(
+                self.marketplaces,
+                default_timeout=self.app.config['MARKETPLACE_PROBE_TIMEOUT'],
+                max_workers=self.app.config['MARKETPLACE_PROBE_WORKERS'],
+                cache_ttl=self.app.config['MARKETPLACE_PROBE_CACHE_TTL'],
+                cache_entries=self.app.config['MARKETPLACE_PROBE_CACHE_ENTRIES'],
+                base_url=self.app.config['MARKETPLACE_PROBE_BASE_URL']
+            )
+        
     def setup_routes(self):
         self.app.route('/')(self.index)
         self.app.route('/api/upload', methods=['POST'])(self.upload_image)
         self.app.route('/api/search', methods=['POST'])(self.search_products)
+        self.app.route('/api/search/stream', methods=['GET', 'POST'])(self.search_stream)
+        self.app.route('/api/search/batch', methods=['POST'])(self.search_batch)
+        self.app.route('/api/search/jobs', methods=['POST'])(self.submit_search_job)
+        self.app.route('/api/search/jobs/<job_id>', methods=['GET'])(self.search_job_status)
+        self.app.route('/api/search/jobs/<job_id>/events', methods=['GET'])(self.search_job_events)
+        self.app.route('/api/marketplaces', methods=['GET'])(self.list_marketplaces)
+        self.app.route('/api/marketplaces/<marketplace_id>/logo', methods=['GET'])(self.marketplace_logo)
         self.app.route('/uploads/<filename>')(self.uploaded_file)
+        self.app.route('/api/cache/stats', methods=['GET'])(self.cache_stats)
+        self.app.route('/api/cache/<file_hash>', methods=['DELETE'])(self.invalidate_cache)
+        self.app.route('/metrics', methods=['GET'])(self.prometheus_metrics)
+        self.app.route('/api/traces/slow', methods=['GET'])(self.slow_traces)
         
     def setup_error_handlers(self):
         self.app.errorhandler(413)(self.too_large)
@@ -59,28 +343,42 @@ class ImageSearchApp:
         
     def upload_image(self):
         try:
-            if 'image' not in request.files:
+            with self.tracer.span('receive'):
+                files = request.files
+            if 'image' not in files:
                 return jsonify({'error': 'No image file provided'}), 400
             
-            file = request.files['image']
+            file = files['image']
             if file.filename == '':
                 return jsonify({'error': 'No file selected'}), 400
             
             if not self.allowed_file(file.filename):
                 return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
             
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], unique_filename)
+            # The multipart parser already streamed the body through an IncomingUpload,
+            # which hashed and sniffed it while writing to disk
+            incoming = file.stream
+            if not isinstance(incoming, IncomingUpload):
+                incoming = self.storage.receive(file.stream)
+            
+            if incoming.mime_type not in self.allowed_mime_types():
+                incoming.close()
+                return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
             
-            file.save(file_path)
-            file_hash = self.generate_file_hash(file_path)
+            with self.tracer.span('commit'):
+                stored = self.storage.commit(incoming)
+            if not stored.duplicate:
+                with self.tracer.span('fingerprint'):
+                    self.fingerprint_for(stored.file_hash, stored.path)
             
             return jsonify({
                 'success': True,
-                'filename': unique_filename,
-                'file_hash': file_hash,
+                'filename': stored.filename,
+                'file_hash': stored.file_hash,
+                'width': stored.width,
+                'height': stored.height,
+                'size': stored.size,
+                'duplicate': stored.duplicate,
                 'message': 'Image uploaded successfully'
             }), 200
             
@@ -95,33 +393,547 @@ class ImageSearchApp:
                 return jsonify({'error': 'No filename provided'}), 400
             
             filename = data['filename']
-            file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], filename)
+            with self.tracer.span('resolve'):
+                file_path = self.storage.resolve(filename)
+                file_hash = self.file_hash_for(filename, file_path) if file_path else None
             
-            if not os.path.exists(file_path):
+            if not file_path:
                 return jsonify({'error': 'File not found'}), 404
             
-            model = self.setup_gemini()
+            result, status = self.run_search(file_path, file_hash, **self.search_options(data))
+            return jsonify(result), status
+            
+        except Exception as e:
+            self.logger.error(f"Error searching products: {str(e)}")
+            return jsonify({'error': 'Failed to search products'}), 500
+            
+    def submit_search_job(self):
+        try:
+            data = request.get_json()
+            if not data or 'filename' not in data:
+                return jsonify({'error': 'No filename provided'}), 400
+            
+            filename = data['filename']
+            file_path = self.storage.resolve(filename)
+            
+            if not file_path:
+                return jsonify({'error': 'File not found'}), 404
+            
+            file_hash = self.file_hash_for(filename, file_path)
+            options = self.search_options(data)
+            key = (file_hash, options['use_cache'], options['refresh_cache'], options['compact'])
+            
+            try:
+                job, coalesced = self.search_jobs.submit(
+                    key, lambda: self.run_search_job(file_path, file_hash, options)
+                )
+            except QueueFullError as e:
+                response = jsonify({'error': 'Search queue is full, please retry later'})
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response, 429
+            
+            response = jsonify({
+                'success': True,
+                'job_id': job.id,
+                'status': job.status,
+                'coalesced': coalesced,
+                'status_url': f"/api/search/jobs/{job.id}",
+                'events_url': f"/api/search/jobs/{job.id}/events"
+            })
+            response.headers['Location'] = f"/api/search/jobs/{job.id}"
+            return response, 202
+            
+        except Exception as e:
+            self.logger.error(f"Error submitting search job: {str(e)}")
+            return jsonify({'error': 'Failed to submit search'}), 500
+            
+    def search_job_status(self, job_id):
+        job = self.search_jobs.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify({'success': True, **job.to_dict()}), 200
+        
+    def search_job_events(self, job_id):
+        job = self.search_jobs.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        def generate():
+            version = None
+            while True:
+                if version != job.version:
+                    version = job.version
+                    event = 'result' if job.done else 'status'
+                    yield self.sse_event(event, job.to_dict())
+                    if job.done:
+                        return
+                else:
+                    yield ": keepalive\n\n"
+                job.wait_for_change(version, timeout=15)
+        
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    def search_options(self, data):
+        # use_cache=false skips the cache entirely, refresh_cache=true re-analyzes and overwrites it
+        return {
+            'use_cache': self.parse_flag(data.get('use_cache'), True),
+            'refresh_cache': self.parse_flag(data.get('refresh_cache'), False),
+            'compact': self.parse_flag(data.get('compact'), False)
+        }
+        
+    def parse_flag(self, value, default):
+        if value is None:
+            return default
+        if isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes')
+        return bool(value)
+        
+    def run_search(self, file_path, file_hash, use_cache=True, refresh_cache=False, compact=False):
+        product_info = None
+        near_duplicate_of = None
+        if use_cache and not refresh_cache:
+            with self.tracer.span('cache_lookup'):
+                product_info, near_duplicate_of = self.lookup_cached_analysis(file_hash, file_path)
+        cached = product_info is not None
+        
+        if not cached:
+            with self.tracer.span('setup_gemini'):
+                model = self.setup_gemini()
             if not model:
-                return jsonify({'error': 'Gemini API not configured'}), 500
+                return {'error': 'Gemini API not configured'}, 500
             
+            image_data, prepared = self.load_prepared_image(file_path, file_hash)
+            try:
+                product_info = self.analyze_image_with_gemini(model, prepared.data, prepared.mime_type)
+            except Exception as e:
+                status, message = self.analysis_error(e)
+                self.logger.warning(f"Rejecting search with {status} ({type(e).__name__})")
+                return {'error': message}, status
+            if use_cache:
+                with self.tracer.span('store'):
+                    self.store_analysis(file_hash, product_info, image_data)
+        
+        return self.search_response(file_hash, product_info, cached, near_duplicate_of, compact), 200
+        
+    def search_response(self, file_hash, product_info, cached, near_duplicate_of=None, compact=False,
+                        probe_results=None):
+        response = {
+            'success': True,
+            'file_hash': file_hash,
+            'cached': cached,
+            'product_info': product_info,
+        }
+        with self.tracer.span('marketplaces'):
+            response['marketplace_results'] = self.search_marketplaces(product_info, compact, probe_results)
+        if near_duplicate_of:
+            response['near_duplicate_of'] = near_duplicate_of
+        return response
+        
+    def search_stream(self):
+        # EventSource can only issue GET requests, so the filename may also come from the query string
+        data = request.get_json(silent=True) if request.method == 'POST' else request.args
+        if not data or 'filename' not in data:
+            return jsonify({'error': 'No filename provided'}), 400
+        
+        filename = data['filename']
+        file_path = self.storage.resolve(filename)
+        
+        if not file_path:
+            return jsonify({'error': 'File not found'}), 404
+        
+        file_hash = self.file_hash_for(filename, file_path)
+        events = self.generate_search_events(file_path, file_hash, **self.search_options(data))
+        return Response(events, mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    def generate_search_events(self, file_path, file_hash, use_cache=True, refresh_cache=False, compact=False):
+        # Event order: product_name, marketplaces (search links only), one field event per
+        # remaining attribute as the model writes it, then done with the full search response
+        started = time.perf_counter()
+        with self.tracer.trace('search_stream'):
+            try:
+                product_info = None
+                near_duplicate_of = None
+                if use_cache and not refresh_cache:
+                    with self.tracer.span('cache_lookup'):
+                        product_info, near_duplicate_of = self.lookup_cached_analysis(file_hash, file_path)
+                
+                if product_info is not None:
+                    self.stream_first_result_seconds.observe(time.perf_counter() - started, cached='true')
+                    yield from self.product_name_events(product_info['product_name'], compact)
+                    yield self.sse_event('done', self.search_response(
+                        file_hash, product_info, True, near_duplicate_of, compact
+                    ))
+                    return
+                
+                with self.tracer.span('setup_gemini'):
+                    model = self.setup_gemini()
+                if not model:
+                    yield self.sse_event('error', {'error': 'Gemini API not configured'})
+                    return
+                
+                image_data, prepared = self.load_prepared_image(file_path, file_hash)
+                parser = IncrementalObjectParser()
+                product_name = None
+                probe = None
+                failed = False
+                try:
+                    chunks = model.stream_content(
+                        [ANALYSIS_PROMPT, {"mime_type": prepared.mime_type, "data": prepared.data}],
+                        generation_config=self.generation_config()
+                    )
+                    for text in chunks:
+                        for key, value in parser.feed(text):
+                            if key == 'product_name' and product_name is None and isinstance(value, str) and value.strip():
+                                product_name = value
+                                self.stream_first_result_seconds.observe(time.perf_counter() - started, cached='false')
+                                yield from self.product_name_events(product_name, compact)
+                                probe = self.start_marketplace_probe(product_name)
+                            elif key != 'product_name':
+                                yield self.sse_event('field', {'name': key, 'value': value})
+                except Exception as e:
+                    self.gemini_errors.inc(error=type(e).__name__)
+                    self.logger.error(f"Error streaming image analysis ({type(e).__name__}): {str(e)}")
+                    if product_name is None:
+                        status, message = self.analysis_error(e)
+                        yield self.sse_event('error', {'error': message, 'status': status})
+                        return
+                    # The name is already out; finish with whatever fields arrived, without caching them
+                    failed = True
+                
+                product_info = self.parse_product_info(parser.buffer)
+                if product_name is None:
+                    yield from self.product_name_events(product_info['product_name'], compact)
+                else:
+                    product_info['product_name'] = product_name
+                if use_cache and not failed:
+                    self.store_analysis(file_hash, product_info, image_data)
+                
+                probe_results = None
+                if probe is not None:
+                    # The probe ran while the model was still writing. One that outlives its own deadline
+                    # is not waited for; those marketplaces go out with unknown counts.
+                    try:
+                        probe_results = probe.result(timeout=self.marketplace_prober.deadline)
+                    except Exception as e:
+                        self.logger.warning(f"Marketplace probe for {file_hash} did not finish ({type(e).__name__})")
+                        probe_results = {}
+                yield self.sse_event('done', self.search_response(
+                    file_hash, product_info, False, compact=compact, probe_results=probe_results
+                ))
+                
+            except Exception as e:
+                self.logger.error(f"Error streaming search: {str(e)}")
+                yield self.sse_event('error', {'error': 'Failed to search products'})
+        
+    def product_name_events(self, product_name, compact=False):
+        yield self.sse_event('product_name', {'product_name': product_name})
+        yield self.sse_event('marketplaces', {'marketplace_searches': self.marketplace_links(product_name, compact)})
+        
+    def marketplace_links(self, product_name, compact=False):
+        encoded_product_name = self.marketplaces.encode_query(product_name)
+        links = []
+        for marketplace in self.marketplaces:
+            link = {
+                'id': marketplace.id,
+                'search_url': self.marketplaces.search_url(marketplace, encoded_product_name)
+            }
+            if not compact:
+                link.update({
+                    'name': marketplace.name,
+                    'url': marketplace.url,
+                    'logo': marketplace.logo,
+                    'description': self.marketplaces.description(marketplace, product_name)
+                })
+            links.append(link)
+        return links
+        
+    def start_marketplace_probe(self, product_name):
+        if self.marketplace_prober is None:
+            return None
+        return self.marketplace_prober.probe_in_background(product_name, self.marketplaces.encode_query(product_name))
+        
+    def sse_event(self, event, data):
+        return f"event: {event}\ndata: {self.app.json.dumps(data)}\n\n"
+        
+    def load_prepared_image(self, file_path, file_hash):
+        with self.tracer.span('read_image'):
             with open(file_path, 'rb') as img_file:
                 image_data = img_file.read()
+        
+        with self.tracer.span('preprocess'):
+            prepared = self.preprocessor.prepare(image_data, file_hash)
+        self.logger.info(
+            f"Prepared {file_hash}: {prepared.original_size} -> {len(prepared.data)} bytes ({prepared.mime_type})"
+        )
+        return image_data, prepared
+        
+    def store_analysis(self, file_hash, product_info, image_data):
+        if not self.is_fallback_product_info(product_info):
+            self.analysis_cache.set(file_hash, product_info)
+            self.index_fingerprint(file_hash, image_data)
+        
+    def search_batch(self):
+        try:
+            if request.files:
+                data = request.form.to_dict()
+                filenames = request.form.getlist('filenames')
+                uploads = request.files.getlist('images')
+            else:
+                data = request.get_json(silent=True) or {}
+                filenames = data.get('filenames') or []
+                uploads = []
             
-            product_info = self.analyze_image_with_gemini(model, image_data)
-            marketplace_results = self.search_marketplaces(product_info)
+            if not isinstance(filenames, list) or (not filenames and not uploads):
+                return jsonify({'error': 'No filenames or images provided'}), 400
             
-            return jsonify({
-                'success': True,
-                'product_info': product_info,
-                'marketplace_results': marketplace_results
-            }), 200
+            if len(filenames) + len(uploads) > self.app.config['BATCH_MAX_ITEMS']:
+                return jsonify({'error': f"Too many images. Maximum is {self.app.config['BATCH_MAX_ITEMS']}"}), 400
+            
+            items = [{'filename': filename} for filename in filenames]
+            for upload in uploads:
+                items.append(self.store_batch_upload(upload))
+            for index, item in enumerate(items):
+                item['index'] = index
+            
+            options = self.search_options(data)
+            
+            return Response(self.generate_batch_results(items, options), mimetype='application/x-ndjson', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
             
         except Exception as e:
-            self.logger.error(f"Error searching products: {str(e)}")
+            self.logger.error(f"Error starting batch search: {str(e)}")
             return jsonify({'error': 'Failed to search products'}), 500
             
+    def store_batch_upload(self, upload):
+        if not upload.filename or not self.allowed_file(upload.filename):
+            return {'filename': upload.filename, 'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}
+        
+        incoming = upload.stream
+        if not isinstance(incoming, IncomingUpload):
+            incoming = self.storage.receive(upload.stream)
+        if incoming.mime_type not in self.allowed_mime_types():
+            incoming.close()
+            return {'filename': upload.filename, 'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}
+        
+        stored = self.storage.commit(incoming)
+        if not stored.duplicate:
+            self.fingerprint_for(stored.file_hash, stored.path)
+        return {'filename': stored.filename}
+        
+    def generate_batch_results(self, items, options):
+        # Lookups, analyses and marketplace probes all run on the batch pool, so the stream starts
+        # at once and each result is written as soon as its pack is done. Misses are regrouped
+        # into analysis packs as lookups finish.
+        with self.tracer.trace('search_batch') as trace:
+            succeeded = 0
+            pack_size = self.app.config['BATCH_PACK_SIZE']
+            lookup = self.tracer.bind(trace, self.lookup_batch_pack)
+            analyze = self.tracer.bind(trace, self.analyze_batch_pack)
+            
+            searchable = []
+            for item in items:
+                if 'error' in item:
+                    yield self.batch_line(item)
+                else:
+                    searchable.append(item)
+            
+            lookups = {
+                self.batch_executor.submit(lookup, searchable[start:start + pack_size], options)
+                for start in range(0, len(searchable), pack_size)
+            }
+            futures = set(lookups)
+            misses = []
+            model = None
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lookups.discard(future)
+                    for item in future.result():
+                        if 'error' in item or 'product_info' in item:
+                            succeeded += 'error' not in item
+                            yield self.batch_line(item)
+                        else:
+                            misses.append(item)
+                
+                while misses and (len(misses) >= pack_size or not lookups):
+                    pack, misses = misses[:pack_size], misses[pack_size:]
+                    model = model or self.setup_gemini()
+                    if not model:
+                        for item in pack:
+                            item['error'] = 'Gemini API not configured'
+                            yield self.batch_line(item)
+                        continue
+                    futures.add(self.batch_executor.submit(analyze, model, pack, options))
+            
+            yield self.app.json.dumps({'summary': {
+                'total': len(items),
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded
+            }}) + '\n'
+        
+    def lookup_batch_pack(self, items, options):
+        hits = []
+        for item in items:
+            try:
+                file_path = self.storage.resolve(item['filename'])
+                if not file_path:
+                    item['error'] = 'File not found'
+                    continue
+                
+                item['file_path'] = file_path
+                item['file_hash'] = self.file_hash_for(item['filename'], file_path)
+                if options['use_cache'] and not options['refresh_cache']:
+                    product_info, _ = self.lookup_cached_analysis(item['file_hash'], file_path)
+                    if product_info is not None:
+                        item['cached'] = True
+                        item['product_info'] = product_info
+                        hits.append(item)
+            except Exception as e:
+                self.logger.error(f"Error preparing batch item {item['filename']}: {str(e)}")
+                item['error'] = 'Failed to search products'
+        
+        self.probe_batch_items(hits, options['compact'])
+        return items
+        
+    def analyze_batch_pack(self, model, items, options):
+        loaded = []
+        for item in items:
+            try:
+                image_data, prepared = self.load_prepared_image(item['file_path'], item['file_hash'])
+                loaded.append((item, image_data, prepared))
+            except Exception as e:
+                self.logger.error(f"Error reading batch item {item['filename']}: {str(e)}")
+                item['error'] = 'Failed to read image'
+        
+        try:
+            product_infos = None
+            if len(loaded) > 1:
+                product_infos = self.analyze_images_with_gemini(model, [prepared for _, _, prepared in loaded])
+            
+            for position, (item, image_data, prepared) in enumerate(loaded):
+                item['cached'] = False
+                if product_infos is not None and product_infos[position] is not None:
+                    item['product_info'] = product_infos[position]
+                else:
+                    item['product_info'] = self.analyze_image_with_gemini(model, prepared.data, prepared.mime_type)
+                if options['use_cache']:
+                    self.store_analysis(item['file_hash'], item['product_info'], image_data)
+        except Exception as e:
+            status, message = self.analysis_error(e)
+            self.logger.error(f"Error analyzing batch pack ({type(e).__name__}): {str(e)}")
+            for item, _, _ in loaded:
+                if 'product_info' not in item:
+                    item.update({'error': message, 'status': status})
+        return self.probe_batch_items(items, options['compact'])
+        
+    def probe_batch_items(self, items, compact=False):
+        for item in items:
+            if 'error' not in item:
+                item['marketplace_results'] = self.search_marketplaces(item['product_info'], compact)
+        return items
+        
+    def batch_line(self, item):
+        line = {'index': item['index'], 'filename': item['filename']}
+        if 'error' in item:
+            line.update({'success': False, 'error': item['error']})
+            if 'status' in item:
+                line['status'] = item['status']
+        else:
+            line.update({
+                'success': True,
+                'file_hash': item['file_hash'],
+                'cached': item['cached'],
+                'product_info': item['product_info'],
+                'marketplace_results': item['marketplace_results']
+            })
+        return self.app.json.dumps(line) + '\n'
+        
+    def run_search_job(self, file_path, file_hash, options):
+        try:
+            with self.tracer.trace('search_job'):
+                result, status = self.run_search(file_path, file_hash, **options)
+        except Exception as e:
+            self.logger.error(f"Error in search job for {file_hash}: {str(e)}")
+            raise RuntimeError('Failed to search products')
+        
+        if status != 200:
+            raise RuntimeError(result['error'])
+        return result
+        
     def uploaded_file(self, filename):
-        return send_from_directory(self.app.config['UPLOAD_FOLDER'], filename)
+        file_path = self.storage.resolve(filename)
+        if not file_path:
+            return jsonify({'error': 'File not found'}), 404
+        
+        file_hash = self.storage.hash_for(filename)
+        etag = file_hash
+        mimetype = None
+        size = request.args.get('size')
+        if size is not None:
+            if not file_hash or not size.isdigit() or int(size) not in self.thumbnails.sizes:
+                return jsonify({'error': 'Unsupported thumbnail size', 'sizes': list(self.thumbnails.sizes)}), 400
+            
+            thumbnail = self.thumbnails.get(file_path, file_hash, int(size))
+            if thumbnail is None:
+                return jsonify({'error': 'Thumbnail could not be generated'}), 422
+            file_path, mimetype = thumbnail
+            etag = f"{file_hash}-t{size}"
+        
+        return self.send_upload(file_path, mimetype, etag)
+        
+    def send_upload(self, file_path, mimetype=None, etag=None):
+        prefix = self.app.config['UPLOAD_ACCEL_REDIRECT_PREFIX']
+        if prefix:
+            # nginx serves the bytes itself, including Range and conditional requests
+            relative_path = os.path.relpath(file_path, self.storage.root).replace(os.sep, '/')
+            response = Response(mimetype=mimetype or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{relative_path}"
+        else:
+            # conditional=True answers If-None-Match, If-Modified-Since and Range requests, and the
+            # body goes out through wsgi.file_wrapper, which servers such as gunicorn turn into sendfile
+            response = send_file(os.path.abspath(file_path), mimetype=mimetype, conditional=True,
+                                 etag=etag or True, max_age=3600)
+        
+        if etag:
+            # Content-addressed names never change meaning, so browsers and CDNs may keep them forever
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 3600
+            response.cache_control.immutable = True
+        return response
+        
+    def cache_stats(self):
+        return jsonify({
+            'success': True,
+            'stats': self.analysis_cache.stats(),
+            'search_jobs': self.search_jobs.stats(),
+            'gemini': self.gemini_client.stats() if self.gemini_client else None,
+            'marketplace_probe': self.marketplace_prober.stats() if self.marketplace_prober else None,
+            'uploads': self.upload_janitor.stats(),
+            'thumbnails': self.thumbnails.stats()
+        }), 200
+        
+    def prometheus_metrics(self):
+        return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+        
+    def slow_traces(self):
+        return jsonify({
+            'success': True,
+            'threshold_seconds': self.tracer.slow_threshold,
+            'sample_rate': self.tracer.sample_rate,
+            'traces': self.tracer.slow_traces()
+        }), 200
+        
+    def invalidate_cache(self, file_hash):
+        self.analysis_cache.invalidate(file_hash)
+        return jsonify({'success': True, 'file_hash': file_hash}), 200
         
     def too_large(self, e):
         return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
@@ -134,205 +946,322 @@ class ImageSearchApp:
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in self.app.config['ALLOWED_EXTENSIONS']
                
+    def allowed_mime_types(self):
+        return {
+            mime_type for mime_type, extension in MIME_EXTENSIONS.items()
+            if extension in self.app.config['ALLOWED_EXTENSIONS']
+        }
+        
+    def file_hash_for(self, filename, file_path):
+        return self.storage.hash_for(filename) or self.generate_file_hash(file_path)
+        
+    def lookup_cached_analysis(self, file_hash, image_source):
+        product_info, near_duplicate_of = self.find_cached_analysis(file_hash, image_source)
+        if near_duplicate_of:
+            self.analysis_lookups.inc(result='near_duplicate')
+        else:
+            self.analysis_lookups.inc(result='hit' if product_info is not None else 'miss')
+        return product_info, near_duplicate_of
+        
+    def find_cached_analysis(self, file_hash, image_source):
+        product_info = self.analysis_cache.get(file_hash)
+        if product_info is not None or self.fingerprint_index is None:
+            return product_info, None
+        
+        fingerprint = self.fingerprint_for(file_hash, image_source)
+        if fingerprint is None:
+            return None, None
+        
+        max_distance = self.app.config['NEAR_DUPLICATE_MAX_DISTANCE']
+        for distance, candidate_hash in self.fingerprint_index.nearest(fingerprint, max_distance):
+            if candidate_hash == file_hash:
+                continue
+            product_info = self.analysis_cache.peek(candidate_hash)
+            if product_info is None:
+                # The candidate's analysis expired or was invalidated in another worker
+                self.fingerprint_index.remove([candidate_hash])
+            else:
+                self.logger.info(f"Reusing analysis of {candidate_hash} for {file_hash} (distance {distance})")
+                self.analysis_cache.set(file_hash, product_info)
+                self.fingerprint_index.add(file_hash, fingerprint)
+                self.pending_fingerprints.delete(file_hash)
+                return product_info, candidate_hash
+        
+        return None, None
+        
+    def compute_fingerprint(self, image_source):
+        try:
+            return compute_dhash(image_source)
+        except Exception as e:
+            self.logger.warning(f"Could not fingerprint image: {str(e)}")
+            return None
+            
+    def fingerprint_for(self, file_hash, image_source):
+        # Each image is decoded for its fingerprint once: at upload, or at its first search
+        if self.fingerprint_index is None:
+            return None
+        
+        fingerprint = self.fingerprint_index.fingerprint_of(file_hash)
+        if fingerprint is None:
+            # A uniform image hashes to 0, so the misses are told apart with None
+            fingerprint = self.pending_fingerprints.get(file_hash)
+        if fingerprint is None:
+            fingerprint = self.compute_fingerprint(image_source)
+            if fingerprint is not None:
+                self.pending_fingerprints.set(
+                    file_hash, fingerprint, 1, time.time() + self.app.config['ANALYSIS_CACHE_TTL']
+                )
+        return fingerprint
+        
+    def index_fingerprint(self, file_hash, image_source):
+        fingerprint = self.fingerprint_for(file_hash, image_source)
+        if fingerprint is not None:
+            self.fingerprint_index.add(file_hash, fingerprint)
+            self.pending_fingerprints.delete(file_hash)
+        
+    def forget_fingerprints(self, file_hashes):
+        if self.fingerprint_index is not None:
+            self.fingerprint_index.remove(file_hashes)
+        
     def generate_file_hash(self, file_path):
         hash_md5 = hashlib.md5()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
         
     def setup_gemini(self):
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            self.logger.error("GEMINI_API_KEY not found in environment variables")
-            return None
+        # One client per process: configuring genai and building the model on every request is wasted work
+        if self.gemini_client is not None:
+            return self.gemini_client
         
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        return model
-        
-    def analyze_image_with_gemini(self, model, image_data):
-        prompt = """
-        Bu resmi analiz et ve görünen ana ürünü veya nesneyi tanımla. 
-        Türkçe olarak detaylı bir açıklama sağla:
-        1. Ürün adı ve türü
-        2. Ana özellikler ve karakteristikler
-        3. Marka (tanımlanabilirse)
-        4. Renk ve stil
-        5. Malzeme (uygulanabilirse)
-        
-        Yanıtınızı bu alanlarla JSON formatında verin:
-        {
-            "product_name": "ürün_adı",
-            "product_type": "kategori",
-            "features": ["özellik1", "özellik2"],
-            "brand": "marka_adı",
-            "color": "renk_açıklaması",
-            "style": "stil_açıklaması",
-            "material": "malzeme_açıklaması"
-        }
+        with self.gemini_lock:
+            if self.gemini_client is None:
+                api_key = os.getenv('GEMINI_API_KEY')
+                if not api_key:
+                    self.logger.error("GEMINI_API_KEY not found in environment variables")
+                    return None
+                
+                genai.configure(api_key=api_key)
+                self.gemini_client = self.create_gemini_client(
+                    lambda: genai.GenerativeModel(self.app.config['GEMINI_MODEL'])
+                )
+        return self.gemini_client
         
-        Lütfen ürün adını Türkçe olarak verin.
-        """
+    def create_gemini_client(self, model_factory):
+        return GeminiClient(
+            model_factory,
+            timeout=self.app.config['GEMINI_TIMEOUT'],
+            rate_limit=self.app.config['GEMINI_RATE_LIMIT'],
+            burst=self.app.config['GEMINI_BURST'],
+            max_attempts=self.app.config['GEMINI_MAX_ATTEMPTS'],
+            retry_budget=self.app.config['GEMINI_RETRY_BUDGET'],
+            hedge=self.app.config['GEMINI_HEDGE'],
+            breaker_threshold=self.app.config['GEMINI_BREAKER_THRESHOLD'],
+            breaker_reset=self.app.config['GEMINI_BREAKER_RESET']
+        )
         
+    def analyze_image_with_gemini(self, model, image_data, mime_type='image/jpeg'):
+        # Failed calls raise so callers can answer 503/504; only unparseable answers fall back
         try:
-            response = model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": image_data}
-            ])
-            
-            try:
-                return json.loads(response.text)
-            except json.JSONDecodeError:
-                text = response.text.lower()
-                product_name = "Resimdeki ürün"
-                
-                lines = response.text.split('\n')
-                for line in lines:
-                    if "product_name" in line or "name" in line:
-                        product_name = line.split(':')[-1].strip().strip('"')
-                        break
-                
-                return {
-                    "product_name": product_name,
-                    "product_type": "Genel",
-                    "features": ["Resim tabanlı ürün"],
-                    "brand": "Bilinmiyor",
-                    "color": "Çeşitli",
-                    "style": "Standart",
-                    "material": "Bilinmiyor"
-                }
-                
+            with self.tracer.span('gemini'):
+                response = model.generate_content(
+                    [ANALYSIS_PROMPT, {"mime_type": mime_type, "data": image_data}],
+                    generation_config=self.generation_config(PRODUCT_INFO_SCHEMA)
+                )
+                text = response.text
         except Exception as e:
-            self.logger.error(f"Error analyzing image: {str(e)}")
-            return {
-                "product_name": "Resimdeki ürün",
-                "product_type": "Genel",
-                "features": ["Resim tabanlı ürün"],
-                "brand": "Bilinmiyor",
-                "color": "Çeşitli",
-                "style": "Standart",
-                "material": "Bilinmiyor"
-            }
+            self.logger.error(f"Error analyzing image ({type(e).__name__}): {str(e)}")
+            self.gemini_errors.inc(error=type(e).__name__)
+            raise
+        
+        with self.tracer.span('parse'):
+            return self.parse_product_info(text)
             
-    def search_marketplaces(self, product_info):
-        product_name = product_info.get('product_name', 'ürün')
-        import urllib.parse
-        encoded_product_name = urllib.parse.quote(product_name)
-        
-        all_marketplaces = [
-            {
-                'id': 'trendyol_search',
-                'name': 'Trendyol',
-                'url': 'https://www.trendyol.com',
-                'search_url': f"https://www.trendyol.com/sr?q={encoded_product_name}",
-                'logo': 'https://play-lh.googleusercontent.com/6Z4D_Qb1s6ZxNIp4hSi38ATABo_df4gl0WX-1bCxaFoj8sOH0ExcrQa3naLkP0_Rp-Id',
-                'description': f'"{product_name}" için Trendyol\'da ara',
-                'estimated_results': random.randint(0, 120),
-                'has_results': None
-            },
-            {
-                'id': 'hepsiburada_search',
-                'name': 'Hepsiburada',
-                'url': 'https://www.hepsiburada.com',
-                'search_url': f"https://www.hepsiburada.com/ara?q={encoded_product_name}",
-                'logo': 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAKoAAACUCAMAAAA02EJtAAABcVBMVEX/////YAAAyvKEDN9XuQBpDm7/XQD/WAD/UAD/VQD8//8Ax/H/6d/9fEj+WgD+eUT/ZxH92cj/+/f/poX9oH3/y77/0Ln+bCP97+j9cSv+lW39u6H/ZSB+AN5kAGn+dDX/glJJtQD/ai//qo/+QQD/yLL93NL+h13+mHXE7/nd9v3+Vg9dAGP/iVf+cDv9w7L+tZbr+v5y2vWm5feS4Pb38/fx5/v3/POg1IPq9eLFn++NOOCcTeShXeapcuj9j2DatKCjl5CLoKRns8NM1PPibkYtwd3LfVu1jHilqaLsTwzme2LcTi7ERj+qN0+VKlqGI2V8HWiFQYTo4eldAHNOAHlzLn+UZ5bGrsisjq6FTorXyNmed6JpH21rs+9Ug+rawfVtUuMyuO9XdDdxJuBIm+xdkTF4xlFZeOdlPmBiY0+KzGo7iutehjm4hupnKmdaoSJpU15Xqha206Dc7szm1vay3JrPrfFswDV0XKd7Mr8YchcoAAAQ5klEQVR4nNWcC3fbOHaARVsBCQaCREqWKJG2bMmilHgsMw8773jbptt2+46nm5nNpHW3007btNm2eba/vrgASAIkpVA2Lc/eM+fYoSHy08V94QKcWq28hIemsVAQNU0ToSAYzbmMggAhdomixZ8xD8MVHl9eyBgvIkWmhYPGbOwfdZ2QEI8JIaHTPfLHs90etvAiXBOPSfWk0cgsfCDC1r4x80PiuUUfcz0S+jNjfwEuMkdRxaBO3yp6lEmDRqdbyJgh7nZ2A7NoVpDVdyoEdcdBwVOQRQ99pwSnvInjT2nRFzaDcembfE3IND97iFo0Iis+wiUR+1j+XnhakcX6mOZvPho49kVuZjuDUf6LU+xXAOq185Nm9caXiDLhuGfljantXZp0N2ulCOPokrf1IpzTrLl7yZs6lpkFnUcVOIEbzbOwpnWZSGBPjOz9aKciDyAdmtWCMbmQ+XMZZ7wVWcMKMyFpZrwA0fEFb+XO9vWvjYdV+Kki/hDrT9ifXci43Jk+QciaVZ6vySyjWPNCrKc6KTX8ynJKKq5v6EHbPF39Hod67KssoWSFpULtQdbhqilQn32EO5eO0IvE6+hha0UbsDvaV0W0Yn/SxdcDDe6s8uFI830zqLJMKxBHL9z2VyhhjzRTx/MrJmWsc42Vls4FjpajcPOKHEoV0lRZkVGybCNIVarZuIIYlRe3obJSVEo9rlZLmdMrc31dvKn22EaZx7ZV5790aVZe9HIT/+LrJuBrpPO1zL4QN/UtZPzBxr2vjSeB4lJ0fjUthQUSzqWToN4fbtzcuL18tK3OAhpdeZTSxRkh8dw/2tjYuPli6Vg7Uqcfd9eEmEgXHk//+Jc3N4D1/rKhoTr9VtV9jxISWYb5J7/ckLLEBFy1f3ax0vGS4s6sP41BmQksjgK+UvjRUpGtciF/dnMjZV0YBbyeOv1rdqlYbimoGzfvLBilBv/rMFQh91W13i0cYjuKT5mr1uLViX1X1eutwjGzVKnoqivUZXJLtYC7BZ5lh8r044suyCsRzQQK1KrmKTRfP5+Koqh1oyBnOapPrT1N6XJvuVoHaT1tDq7Np4SonpUPAor7X6tPCVE9KxcExun809m14KmiqfW+HgQ8JaYerGHZ9zW5rVqrnrKU7K90jUKHSaWlgOeU3JJR1apVAraS/a208u8brRa+2PZEsZApQqelWFW1bqh/cBSlDtLLPQplS3Wo7oA9xyqVXjRrVR1LaaahbooGuq4S1euz706bpcYqQUCNV14jmX+qrqarRnWhQWmV657deZGivkgda0spqdTir2pUtiZFtFkyv9wvDK3tdP4DNVItRL0wvTfZKpsJbysWkIRWr0nT+VdHC1SmDL/d9rVo6/jtTjRJLrkgcKeur28Qe91xpzOeEDsex/4r+z2LLCBM/d+a5FDDrRE2QYaxfl2/xy+YuC822IlxcHCAoP8MV2nc4ba9U1NKn28kuG3r4MAqmwyVouVmvHYdp6hIC/iAik7jTRCKxfcgh8m2CLUG8AHSQgbqeQ2ZnK2hKCKcVpKtkTV1ARWv0JS+o1qAvNZPvCqzv8ETA4WzENxCaB9m3BuCZSMkDl3g3Ri1f5iAUW7xBMIywpY4YAGOvxqq/SJVq6xa3bSbjo80QxI5jAaNwybvDkP0tnnTlo4OTxu8LQ5PBlSgp6NRwL+ByWKnPcDQ04m63fEcrrF6bTVUzQKEsaapCrX0dprQ6m7I+CegV5OpcMJ1CuZoO1O4GIQxatMnJBzz33G35lpQT3LPY36LkOWviqrGABGu0jU1zXRTua1icQ0aL7TPciNNa2+viWAdZgvUnrBQn2u9YxNA7XN/t8dmq0U74lHlUdUsIBLWNDXVtj4WULF02CN4cqsWDtm1A1l72xOLd4s5atw5cEHX7EsDKsuijjgpxKLUqraqlVfcWJWsama2p3iwkuGrK1AdniecUAi/2BOo+/GMROBNc+JaIka0pv5WKGZhVdR7qQXwyBqOEtTsSoWjbtkpqiFM1RjFAhaCiAcRwIo/1QXUXlgbCB9AJjZHUxlXV0NV1y1grJO0ABhlkp6aWAWqO+GGjWKB36lANeJPhQegfwc2IuIsiChGzuqodzKoflIA0EZmaA61VTvC/MmaZFCdA7mUdP0GTU4TUbRysFJzK2wNMO9Momo25eW1yg0ADYmjisttFSeoYBV9HvY8J2rGRwJNlq9WRU39CioWd5CgWtlN3wJUh2etTMUh3Cq2HqjTEAt7ooKxXafTEE4broyatoSgeeU1krIq11ItQCWQeWg80AOlyhQQBytvF0bM3KjDRA6ED8OibVXUtNkKxZU3T9zKyq6qC1BF1IyXcoOApdKBMAA0EqXeGL46jWpNC+O44rcviKosBhkqSfZ+Ec1WvQURoNYFezGHoed54dRkQYBO4sRK2yyx8tMZKPBgB4INPPKYHXgTnrnIyqh3lHXr7RpJC7VWdmQRqgiXyOrvNvjRW8ySrEClhmWZ4giZFTHLglCGrOagM+PVIW6vmli1niArWdO6GvW/itpywRYtoUNu4zhwpVuZs+ROvDit+WIcFNug3xFZPVjZL1TUtK6ih9mRLVbV78eo+6zqRy64dDQSJ6gRNQO+YyQiQG3ALjODMI22sKTJyBRFLRy6bnos2nQs0yy9CqhpJSurrboJav7cUDQej9vS10ib/UN2G8LxYYuVzEazIxZSAtV2/d2e0ZrPku4sGU/7FGOMhjNx8mkL7rFK8/auijpJUFeYGdsjrFghcYEitcqMgxDtzLUNx8PDReewy6CmBnBPRb3wBkCCWrkoOeCesv//s0eNfl9Q7/8+adWvxFZZmLp6VMWt2l//aLF4/V6vR6tEjOWuirosrjYxpXpraIms0HLrUpPiYZktBw01zVa/+vPswAYrR6xLHIBejMqSWplDcXq2YjXAr/7iL//qr//mb2+8zKFCg/1KUKHBUUarWg1w9s23f/fttzs7N27s/Ppnh6pXVmcMUsrO8c8N9Y7Wtzx7k7DunP3cUNUtoTu1498kqN8sQnUJlCHx1bhFrf0e/2R1jPybRzK1C7wZREJ4m0hH5Xcvfsnotra2On6Von5XjOrM+obRm44FbHfGRL4hZbfhH2wdHcLPo5ob7SLoTdRspz1lH2oNT6N0bTkZ9BFtTY9qjoLqsEKxZbR6A1Yc5ubvnrZirX3/TYL6fRGq4x/AEgqZ8nSwz2psK94m4cX3FqOAi237EFOB2jngZTaLSTiQ4dqdIXYfWBWMuyhGtccBlgNNNMjtkd7NoKa2+psCVDRIlwmcAjIx3ZWofd7VEssZ2haHyR2x68fbRXz5wge7zaTYMButGLWtDsS5o11KrIIW+3cpajaw8hYBZWs5S6zuzKErURsFqMYw4I91alvwOYSDnsEbKwgSnthwMNmtqCEax0T0jNjAVq/F12HZzKieDIGe1es3SbR687oA1cBz3+mecp1Yvr0EFRmwOrEcfrYItRy2/u7yFu0Y+o2cdNp1jkb8a3NU3ogZddlAh68kM6n9dgZVCQE73xWg4o4N5s477Gi0TKsGnk482625Bjax2AC3YTQ0ufnRCCQ6TTMqUdnilw0Uay1uQkP9+dn+ai0NATsZv+K2akgqbohBuAQ1vup22u22jBESVbayZV++Id3Ki9jADr/IG+BZ1PvZLZYfkhCw80rPV4CK2zKEbBnC7Baj4jguyT/aNvGhWcxQ+SmOxBQjM5MCbK8LAzKod5QGu9gLeJ2ivtGTAA9W8aY7b6yZ0WJUNE8f7oZb7cMetbi3MNQQ5tyKHVxNAWSrfdpn3sZDjI6a32E5TlBvfKP7FUeN94dEh28Jaro/Y5NZy8JUbtABqmOqPTESxKhk1rOwGQ/MoN7K7VvVdtJ89UMeNVYVR0U6qq2hJq8QOD14OjVN3IM9JEAFrdM4GyWo4RwGIujbnOYNQD3HKC+l+WrnhmasIlvF928qBiAdxO4VadVrwQS3pp0JsbvCrfjZOBx/Fb5bwCMAKNuYzthAJ+dW6h5rfM7i9SIL4Ki+1AXficm6VasIlbcoA76pLXa2Bi5BSLGliXSrLfiJxO73Vg71VsHplbNfpxbwKotKhxKVb1gERID0ZNjhLd4sKmQAufzlR+IhAvBUEK8zO9KtoAUrw35BsLqrVYBS0jLghhYDeAqQIYb0eTC0xWJMKgh2fHOo/Mym3JDnt4C4yg/yyCMcW4GMqxCqsejL2/C6jYaqzX9Sc32XWoCWsERi7fmebYf8bRjY2PBEtA9dl7T533NahRcgzY5QqgxW4hUu2nBqtjuZx9kK2q0m34Gy+ZxpqEqqUl4SOXuZJiw1C3BUVvaMmvOAPwrm3R3yq8GQXeMVUU6rvLVOO4RMGihGdXf5DYJhcy4+BahHvAffCcnkUEQ2pRmtnWNWXhD4IbWAG691VMRmRhZp8gim2LtkFxk6KDCnVcKfi/f3LWo2kdzoJvzL8lvRXVkEkmE6cGjoffMF56xUC1Dra7AfqzuV5z/iAyFu/J4sDhyoQmLU9IWnKH6H0ho4Vrwn3w1kwYob8FIH7wNM5EBkNRz+1dNn319weq2maFVZDO4GQWA6bgf+RyWU3Ts2br91ABuWp8QeHwQBBlT2M0hSgD0J+HmbwLeJFQQH4vgAOaTwPzwxT11vxEbvMlR7q8VP4QSRSwx2LbVVdXtVOxOoZAE1Y9kgoMeu70/UBaZNuhPHs+WQmvJTituNokhEVuUvxI/EiSflWjcaR5PsQF2p+ms3ZzeUeJVtB1yDqBtWmbdujhXHylat1yGqUrOvBrxWjPVlth+wdlFXKrmz1ko7IL/IXruoLzHk32RS4lW+I7Rm0U5aF7zI9FKx1mxDYM3yQnWqgr+ras21hNYq976iVHWRfb2edVs5sbLgnTslCGRXLusU+64y+0UvBoG8UtPrtZmA9sZd0etWIGeKWjOrrPWJlvwXvx76vepZr66F9fjv1elf/NLt8UvVBK4lETze/oeUdGPRC5dMXiuo2f7FWuR8e3PzH3/7FZ/iolUtb/7pw9oQpZww0s3NH/+5uE7RJd1v2fndv+z99GBdjEJOnnLUzc1/5VFgyfSDxO2LnX+r1+t7b9fKevJMkjLF/nb59HORUeDf6/W1sz5PSJn8x9JX7rlAft3Z+c+6kL2Ha0CUD36nkm4/KxErmbn+7r/q9YR1TW9fZkifnJT50Ov//p96XWG9akgux9rsb26fl/vY+726xroGe9V1urn9uOTn3Ic669tHV4rJ5CSj03elP/ngrc760xWzJvFUkj5fofx48FOG9Urz1scM6dNSLhXLowzr3vur4qzVPm/rpM9WIs2xMue6IiM40R2qbJhS5VE9w3o1RvDxWYZ0c2XSvF7re58qj1rHj7czpKvZ6WLWqhV7nlHp6na6kLVerzR1vfsxS3oxnYI8eJhl3ftSlRUcn/+4nSV9d4nl3INPOb3uvf1QRQFz/jwLWj6bLpD3eznF1i9tsu7HZ5s50O3Pl7xrkcEyM/hwCTM4Pn+S0yhzqI+XJc0VBHEw+HTBlPDx89M86Gppfwnr+yLW+pe3F7CD8+cFGoXJr6o/UmQEHPfhhwflTwyefHzHoIpALx6j8uJ+qi+A/fLwfSnlfvz8rmjigXTzcbUtp0dFFitpf3r7fqnhnnx+/uxJkT4rV6mUD8VWIHj39r68/fThw9kJk2Mh8OvH88dgnNsLOAH0vHLQGuSDL4thOe7e/24+efrsOZdnT59sLoEUpE8qnvtUHj0sNtlE/m9bl8WUwkhXmvv/BwnhzsnzhJR1AAAAAElFTkSuQmCC',
-                'description': f'"{product_name}" için Hepsiburada\'da ara',
-                'estimated_results': random.randint(0, 180),
-                'has_results': None
-            },
-            {
-                'id': 'n11_search',
-                'name': 'N11',
-                'url': 'https://www.n11.com',
-                'search_url': f"https://www.n11.com/arama?q={encoded_product_name}",
-                'logo': 'https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcQGbRLOj0nYDOIpNFugmdpczPp3KboITwz-DQ&s',
-                'description': f'"{product_name}" için N11\'de ara',
-                'estimated_results': random.randint(0, 90),
-                'has_results': None
-            },
-            {
-                'id': 'gittigidiyor_search',
-                'name': 'GittiGidiyor',
-                'url': 'https://www.gittigidiyor.com',
-                'search_url': f"https://www.gittigidiyor.com/arama?k={encoded_product_name}",
-                'logo': 'https://cdn6.aptoide.com/imgs/4/3/3/4338163d82a5b5a2e3ee42d2993f0752_icon.png',
-                'description': f'"{product_name}" için GittiGidiyor\'da ara',
-                'estimated_results': random.randint(0, 110),
-                'has_results': None
-            },
-            {
-                'id': 'amazon_tr_search',
-                'name': 'Amazon TR',
-                'url': 'https://www.amazon.com.tr',
-                'search_url': f"https://www.amazon.com.tr/s?k={encoded_product_name}",
-                'logo': 'https://upload.wikimedia.org/wikipedia/commons/d/de/Amazon_icon.png',
-                'description': f'"{product_name}" için Amazon Türkiye\'de ara',
-                'estimated_results': random.randint(0, 200),
-                'has_results': None
-            },
-            {
-                'id': 'ciceksepeti_search',
-                'name': 'Çiçeksepeti',
-                'url': 'https://www.ciceksepeti.com',
-                'search_url': f"https://www.ciceksepeti.com/arama?query={encoded_product_name}",
-                'logo': 'https://play-lh.googleusercontent.com/WN7xiunClF_KWDcrfWzETenHPH_D4GwPx5uh78gqfl4NCfE1Z2MGsORH-6XyKju5QbvE',
-                'description': f'"{product_name}" için Çiçeksepeti\'nde ara',
-                'estimated_results': random.randint(0, 80),
-                'has_results': None
-            },
-            {
-                'id': 'vatanbilgisayar_search',
-                'name': 'Vatan Bilgisayar',
-                'url': 'https://www.vatanbilgisayar.com',
-                'search_url': f"https://www.vatanbilgisayar.com/arama/{encoded_product_name}/",
-                'logo': 'https://play-lh.googleusercontent.com/iP50PzgiBCES-7gmSk4Kp7uKnE1ql7Y3_4qedM5-4bvfhAHa9zhBQt9F-wtUSbfRewKo',
-                'description': f'"{product_name}" için Vatan Bilgisayar\'da ara',
-                'estimated_results': random.randint(0, 60),
-                'has_results': None
-            },
-            {
-                'id': 'teknosa_search',
-                'name': 'Teknosa',
-                'url': 'https://www.teknosa.com',
-                'search_url': f"https://www.teknosa.com/arama/?s={encoded_product_name}",
-                'logo': 'https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcRVUmjFy92NyVFaKsT8Ltx1w-VyQzra6JIsYQ&s',
-                'description': f'"{product_name}" için Teknosa\'da ara',
-                'estimated_results': random.randint(0, 100),
-                'has_results': None
-            },
-            {
-                'id': 'media_markt_search',
-                'name': 'MediaMarkt',
-                'url': 'https://www.mediamarkt.com.tr',
-                'search_url': f"https://www.mediamarkt.com.tr/tr/search.html?query={encoded_product_name}",
-                'logo': 'https://encrypted-tbn0.gstatic.com/images?q=tbn:ANd9GcR0PRZsAkIJmDMqLgukc0OS-sBQ-QLEdsC0aQ&s',
-                'description': f'"{product_name}" için MediaMarkt\'ta ara',
-                'estimated_results': random.randint(0, 70),
-                'has_results': None
-            },
-            {
-                'id': 'dolap_search',
-                'name': 'Dolap',
-                'url': 'https://www.dolap.com',
-                'search_url': f"https://www.dolap.com/arama?q={encoded_product_name}",
-                'logo': 'https://play-lh.googleusercontent.com/TAKFVR423YJ-1fwICdV3xmP55EozpKDw_4PJgINRiFSu2nxaiwh2ZthsKUjp92Y_ta7Y=w240-h480-rw',
-                'description': f'"{product_name}" için Dolap\'ta ara',
-                'estimated_results': random.randint(0, 150),
-                'has_results': None
-            }
+    def analysis_error(self, error):
+        # Maps a failed Gemini call to a response status and message
+        if isinstance(error, GeminiTimeoutError):
+            return 504, 'Image analysis timed out, please retry later'
+        if isinstance(error, GeminiError) or error_status_code(error) in RETRYABLE_STATUS_CODES:
+            return 503, 'Image analysis is temporarily unavailable, please retry later'
+        return 502, 'Image analysis failed'
+        
+
+    def generation_config(self, schema=None):
+        # Schema-constrained output removes Markdown fences and prose around the JSON. The schema
+        # is left out when streaming: the API emits schema properties alphabetically, which would
+        # push product_name behind brand, color and features.
+        config = {'response_mime_type': 'application/json'}
+        if schema is not None:
+            config['response_schema'] = schema
+        return config
+        
+    def parse_product_info(self, text):
+        is_json = False
+        try:
+            product_info = json.loads(strip_code_fences(text))
+            is_json = True
+            if self.is_valid_product_info(product_info):
+                return product_info
+        except json.JSONDecodeError:
+            pass
+        
+        # Truncated or chatty responses usually still hold complete leading fields
+        parser = IncrementalObjectParser()
+        parser.feed(text)
+        if isinstance(parser.fields.get('product_name'), str) and parser.fields['product_name'].strip():
+            self.analysis_fallbacks.inc(reason='salvaged')
+            return dict(self.fallback_product_info(), **parser.fields)
+        
+        self.analysis_fallbacks.inc(reason='unparseable')
+        # Only prose is scanned line by line; in JSON the name was missing or not a string
+        product_name = None
+        if not is_json and 'product_name' not in parser.fields:
+            for line in text.split('\n'):
+                if "product_name" in line or "name" in line:
+                    product_name = line.split(':')[-1].strip().strip(',').strip('"').strip()
+                    if product_name.startswith(('{', '[')):
+                        product_name = None
+                    break
+        return self.fallback_product_info(product_name)
+        
+    def analyze_images_with_gemini(self, model, prepared_images):
+        prompt = f"""
+        Sana {len(prepared_images)} resim veriyorum. Her resimde görünen ana ürünü veya nesneyi tanımla.
+        Her resim için Türkçe olarak ürün adı ve türü, ana özellikler, marka, renk, stil ve malzeme belirt.
+        
+        Yanıtını, resimlerle aynı sırada ve her resim için bir nesne olacak şekilde bir JSON dizisi olarak ver:
+        [
+            {{
+                "product_name": "ürün_adı",
+                "product_type": "kategori",
+                "features": ["özellik1", "özellik2"],
+                "brand": "marka_adı",
+                "color": "renk_açıklaması",
+                "style": "stil_açıklaması",
+                "material": "malzeme_açıklaması"
+            }}
         ]
         
-        for marketplace in all_marketplaces:
-            marketplace['has_results'] = marketplace['estimated_results'] > 0
+        Lütfen ürün adlarını Türkçe olarak verin.
+        """
         
-        marketplace_searches = [mp for mp in all_marketplaces if mp['has_results']]
+        contents = [prompt]
+        for position, prepared in enumerate(prepared_images, start=1):
+            contents.append(f"Resim {position}:")
+            contents.append({"mime_type": prepared.mime_type, "data": prepared.data})
+        
+        try:
+            response = model.generate_content(contents, generation_config=self.generation_config({
+                "type": "array",
+                "items": PRODUCT_INFO_SCHEMA
+            }))
+            text = response.text
+        except Exception as e:
+            self.gemini_errors.inc(error=type(e).__name__)
+            if self.analysis_error(e)[0] != 502:
+                # Retries already ran out; calling once per image would only add load
+                raise
+            self.logger.warning(f"Multi-image analysis failed, analyzing individually ({type(e).__name__}): {str(e)}")
+            return None
+        
+        try:
+            product_infos = json.loads(strip_code_fences(text))
+        except json.JSONDecodeError:
+            self.logger.warning("Multi-image analysis returned invalid JSON, analyzing individually")
+            return None
+        
+        if not isinstance(product_infos, list) or len(product_infos) != len(prepared_images):
+            self.logger.warning("Multi-image analysis returned an unexpected shape, analyzing individually")
+            return None
         
+        # Entries without a usable name are left as None and analyzed on their own
+        checked = [product_info if self.is_valid_product_info(product_info) else None for product_info in product_infos]
+        invalid = checked.count(None)
+        if invalid:
+            self.logger.warning(f"Multi-image analysis returned {invalid} invalid entries, analyzing them individually")
+        return checked
+        
+    def is_valid_product_info(self, product_info):
+        return (isinstance(product_info, dict) and isinstance(product_info.get('product_name'), str)
+                and bool(product_info['product_name'].strip()))
+        
+    def fallback_product_info(self, product_name=None):
+        product_info = dict(FALLBACK_PRODUCT_INFO)
+        product_info['features'] = list(FALLBACK_PRODUCT_INFO['features'])
+        if product_name:
+            product_info['product_name'] = product_name
+        return product_info
+        
+    def is_fallback_product_info(self, product_info):
+        return all(
+            product_info.get(key) == value
+            for key, value in FALLBACK_PRODUCT_INFO.items()
+            if key != 'product_name'
+        )
+            
+    def search_marketplaces(self, product_info, compact=False, probe_results=None):
+        # probe_results comes from a probe the caller already ran; None probes here
+        product_name = product_info.get('product_name', 'ürün')
+        encoded_product_name = self.marketplaces.encode_query(product_name)
+        if probe_results is None:
+            probe_results = self.marketplace_prober.probe(product_name, encoded_product_name) if self.marketplace_prober else {}
+        
+        marketplace_searches = []
+        for marketplace in self.marketplaces:
+            # Marketplaces without a probe, or whose probe failed, stay listed with an unknown count
+            result = probe_results.get(marketplace.id)
+            estimated_results = result.count if result is not None else None
+            if estimated_results == 0:
+                continue
+            
+            search_url = self.marketplaces.search_url(marketplace, encoded_product_name)
+            if compact:
+                marketplace_searches.append({
+                    'id': marketplace.id,
+                    'search_url': search_url,
+                    'estimated_results': estimated_results
+                })
+            else:
+                marketplace_searches.append({
+                    'id': marketplace.id,
+                    'name': marketplace.name,
+                    'url': marketplace.url,
+                    'search_url': search_url,
+                    'logo': marketplace.logo,
+                    'description': self.marketplaces.description(marketplace, product_name),
+                    'estimated_results': estimated_results,
+                    'has_results': True if estimated_results else None,
+                    'top_listings': result.listings if result is not None else []
+                })
+        
+        # Compact responses leave out the product_info copy; it is already at the top level
+        if compact:
+            return {'marketplace_searches': marketplace_searches}
         return {
             'marketplace_searches': marketplace_searches,
             'product_info': product_info
         }
         
+    def list_marketplaces(self):
+        response = jsonify({'success': True, 'marketplaces': self.marketplaces.public_definitions})
+        response.set_etag(self.marketplaces.etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+        return response.make_conditional(request)
+        
+    def marketplace_logo(self, marketplace_id):
+        logo = self.marketplaces.logos.get(marketplace_id)
+        if not logo:
+            return jsonify({'error': 'Logo not found'}), 404
+        
+        response = Response(logo.data, mimetype=logo.mimetype)
+        response.set_etag(logo.etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+        
 
 
 app_instance = ImageSearchApp()
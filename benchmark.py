@@ -0,0 +1,540 @@
+import os
+import io
+import sys
+import json
+import math
+import logging
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from PIL import Image, ImageDraw
+from werkzeug.serving import make_server
+from gemini_client import FakeAPIError, FakeResponse
+
+PHASES = ('upload', 'search', 'search_cached', 'search_stream')
+
+FAKE_PRODUCTS = (
+    ('Kırmızı spor ayakkabı', 'Ayakkabı', 'Nike', 'Kırmızı', 'Spor', 'Tekstil'),
+    ('Deri omuz çantası', 'Çanta', 'Bilinmiyor', 'Kahverengi', 'Klasik', 'Deri'),
+    ('Kablosuz kulaklık', 'Elektronik', 'Sony', 'Siyah', 'Modern', 'Plastik'),
+    ('Seramik kahve kupası', 'Mutfak', 'Bilinmiyor', 'Beyaz', 'Minimal', 'Seramik'),
+    ('Çelik kol saati', 'Aksesuar', 'Casio', 'Gümüş', 'Klasik', 'Paslanmaz çelik'),
+)
+
+GARBAGE_RESPONSES = (
+    'Bu görselde bir ürün görüyorum ancak detayları net değil.',
+    'I am sorry, I cannot help with that image.',
+    '{"product_name": "Yarım kalmış yanıt", "features": ["',
+)
+
+
+class BenchmarkModel:
+    # Stands in for genai.GenerativeModel: sleeps for the configured latency, fails at the
+    # configured rate and answers with a weighted mix of well-formed and broken responses
+    def __init__(self, latency=0.8, jitter=0.2, error_rate=0.0, shapes=None, seed=0, chunk_size=24):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.shapes = shapes or {'json': 1.0}
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.errors = 0
+        self.shape_counts = {shape: 0 for shape in self.shapes}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        images = sum(1 for part in contents if isinstance(part, dict))
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter * self.latency))
+            failed = self._random.random() < self.error_rate
+            error_code = self._random.choice((429, 500, 503))
+            shape = self._random.choices(list(self.shapes), weights=list(self.shapes.values()))[0]
+            products = [self._random.choice(FAKE_PRODUCTS) for _ in range(max(1, images))]
+            garbage = self._random.choice(GARBAGE_RESPONSES)
+            if failed:
+                self.errors += 1
+            else:
+                self.shape_counts[shape] += 1
+
+        if failed:
+            time.sleep(delay / 4)
+            raise FakeAPIError(error_code)
+
+        text = self.render(shape, products, images > 1, garbage)
+        if stream:
+            return self._stream(text, delay)
+        time.sleep(delay)
+        return FakeResponse(text)
+
+    def render(self, shape, products, as_array, garbage):
+        if shape == 'garbage':
+            return garbage
+
+        infos = [{
+            'product_name': name,
+            'product_type': product_type,
+            'features': [f'{material} malzeme', f'{style} tasarım'],
+            'brand': brand,
+            'color': color,
+            'style': style,
+            'material': material
+        } for name, product_type, brand, color, style, material in products]
+        text = json.dumps(infos if as_array else infos[0], ensure_ascii=False, indent=2)
+        if shape == 'fenced':
+            return f'```json\n{text}\n```'
+        return text
+
+    def _stream(self, text, delay):
+        chunks = [text[start:start + self.chunk_size] for start in range(0, len(text), self.chunk_size)]
+        # Time to first token is a quarter of the latency; the rest is spread across the chunks
+        time.sleep(delay / 4)
+        for position, chunk in enumerate(chunks):
+            if position:
+                time.sleep(delay * 3 / 4 / max(1, len(chunks) - 1))
+            yield FakeResponse(chunk)
+
+
+def generate_corpus(count, width, height, image_format='mixed', seed=0):
+    # Smooth colour fields with a few shapes: compresses like a photo, unlike pure noise
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        base = Image.frombytes('RGB', (8, 6), rng.randbytes(8 * 6 * 3)).resize((width, height), Image.BICUBIC)
+        draw = ImageDraw.Draw(base)
+        for _ in range(rng.randint(3, 8)):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            box = (x0, y0, x0 + rng.randint(20, width // 2), y0 + rng.randint(20, height // 2))
+            fill = tuple(rng.randrange(256) for _ in range(3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=fill)
+
+        use_png = image_format == 'png' or (image_format == 'mixed' and index % 5 == 4)
+        output = io.BytesIO()
+        if use_png:
+            base.save(output, format='PNG', optimize=True)
+            corpus.append((f'image_{index:04d}.png', output.getvalue(), 'image/png'))
+        else:
+            base.save(output, format='JPEG', quality=90)
+            corpus.append((f'image_{index:04d}.jpg', output.getvalue(), 'image/jpeg'))
+    return corpus
+
+
+def percentile(ordered, percent):
+    if not ordered:
+        return None
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100.0) - 1)]
+
+
+def summarize_latencies(latencies):
+    ordered = sorted(latencies)
+    return {
+        'mean': round(sum(ordered) / len(ordered), 6) if ordered else None,
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1] if ordered else None,
+    }
+
+
+def memory_usage():
+    # VmRSS/VmHWM from /proc on Linux, peak RSS from getrusage elsewhere
+    usage = {'rss_mb': None, 'peak_rss_mb': None}
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    usage['rss_mb'] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith('VmHWM:'):
+                    usage['peak_rss_mb'] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['peak_rss_mb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return usage
+
+
+def io_write_bytes():
+    try:
+        with open('/proc/self/io') as io_stats:
+            for line in io_stats:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def directory_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            iterator = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+    return total
+
+
+class Benchmark:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.corpus = generate_corpus(args.images, args.width, args.height, args.image_format, args.seed)
+        self.filenames = []
+        self._local = threading.local()
+
+        # The app reads its configuration from the environment when it is imported
+        os.environ.update({
+            'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+            'ANALYSIS_CACHE_PATH': os.path.join(workdir, 'cache', 'analysis.sqlite3'),
+            'LOG_FILE': os.path.join(workdir, 'app.log'),
+            'LOG_LEVEL': args.log_level,
+            'MARKETPLACE_PROBE_ENABLED': 'false',
+            'GEMINI_RATE_LIMIT': str(args.gemini_rate_limit),
+            'GEMINI_BURST': str(max(1, int(args.gemini_rate_limit))),
+            'UPLOAD_JANITOR_INTERVAL': str(24 * 3600),
+        })
+        import app as app_module
+        self.instance = app_module.app_instance
+        # Per-request access logs would otherwise dominate the run and its output
+        logging.getLogger('werkzeug').setLevel(args.log_level)
+        self.model = BenchmarkModel(
+            latency=args.latency, jitter=args.latency_jitter, error_rate=args.error_rate,
+            shapes=args.shapes, seed=args.seed
+        )
+        self.instance.gemini_client = self.instance.create_gemini_client(lambda: self.model)
+
+        self.server = make_server('127.0.0.1', 0, self.instance.app, threaded=True)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, name='benchmark-server', daemon=True).start()
+
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def written_bytes(self):
+        return sum(directory_bytes(os.path.join(self.workdir, name)) for name in ('uploads', 'cache', 'app.log'))
+
+    def upload(self, index):
+        name, data, mime_type = self.corpus[index % len(self.corpus)]
+        response = self.session().post(f'{self.base_url}/api/upload', files={'image': (name, data, mime_type)})
+        if response.ok:
+            self.filenames.append(response.json()['filename'])
+        return response.ok, len(data), len(response.content), None
+
+    def search(self, index, refresh_cache=True):
+        payload = {'filename': self.filenames[index % len(self.filenames)], 'refresh_cache': refresh_cache}
+        body = json.dumps(payload).encode('utf-8')
+        response = self.session().post(
+            f'{self.base_url}/api/search', data=body, headers={'Content-Type': 'application/json'}
+        )
+        return response.ok, len(body), len(response.content), None
+
+    def search_stream(self, index):
+        # Measures the time until marketplace links arrive as well as the whole stream
+        started = time.perf_counter()
+        payload = {'filename': self.filenames[index % len(self.filenames)], 'refresh_cache': True}
+        body = json.dumps(payload).encode('utf-8')
+        response = self.session().post(
+            f'{self.base_url}/api/search/stream', data=body,
+            headers={'Content-Type': 'application/json'}, stream=True
+        )
+        first_result = None
+        received = 0
+        ok = response.ok
+        for line in response.iter_lines():
+            received += len(line) + 1
+            if line == b'event: marketplaces' and first_result is None:
+                first_result = time.perf_counter() - started
+            elif line == b'event: error':
+                ok = False
+        response.close()
+        return ok and first_result is not None, len(body), received, first_result
+
+    def run_phase(self, name):
+        operation = {
+            'upload': self.upload,
+            'search': self.search,
+            'search_cached': lambda index: self.search(index, refresh_cache=False),
+            'search_stream': self.search_stream,
+        }[name]
+        count = self.args.requests or len(self.corpus)
+
+        if name != 'upload':
+            if not self.filenames:
+                for index in range(len(self.corpus)):
+                    self.upload(index)
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+                list(executor.map(operation, range(self.args.warmup)))
+
+        latencies = []
+        first_results = []
+        errors = 0
+        bytes_sent = bytes_received = 0
+        lock = threading.Lock()
+
+        def timed(index):
+            nonlocal errors, bytes_sent, bytes_received
+            started = time.perf_counter()
+            try:
+                ok, sent, received, first_result = operation(index)
+            except requests.RequestException:
+                ok, sent, received, first_result = False, 0, 0, None
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                bytes_sent += sent
+                bytes_received += received
+                errors += not ok
+                if first_result is not None:
+                    first_results.append(first_result)
+
+        model_calls = self.model.calls
+        disk_before = self.written_bytes()
+        io_before = io_write_bytes()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            list(executor.map(timed, range(count)))
+        wall_time = time.perf_counter() - started
+        io_after = io_write_bytes()
+
+        result = {
+            'requests': count,
+            'errors': errors,
+            'error_rate': round(errors / count, 4),
+            'wall_seconds': round(wall_time, 3),
+            'rps': round(count / wall_time, 2),
+            'latency': summarize_latencies(latencies),
+            'bytes_sent': bytes_sent,
+            'bytes_received': bytes_received,
+            'bytes_written': self.written_bytes() - disk_before,
+            'io_write_bytes': io_after - io_before if io_before is not None and io_after is not None else None,
+            'model_calls': self.model.calls - model_calls,
+            'memory': memory_usage(),
+        }
+        if first_results:
+            result['first_result_latency'] = summarize_latencies(first_results)
+        return result
+
+    def close(self):
+        self.server.shutdown()
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def benchmark_config(args):
+    # Runs are only comparable when these match
+    return {
+        'images': args.images,
+        'image_size': f'{args.width}x{args.height}',
+        'image_format': args.image_format,
+        'seed': args.seed,
+        'concurrency': args.concurrency,
+        'requests': args.requests or args.images,
+        'warmup': args.warmup,
+        'latency': args.latency,
+        'latency_jitter': args.latency_jitter,
+        'error_rate': args.error_rate,
+        'shapes': args.shapes,
+        'gemini_rate_limit': args.gemini_rate_limit,
+    }
+
+
+def compare_results(current, baseline, thresholds):
+    # Returns (rows, regressions); latency and error thresholds are relative, floors absolute
+    rows = []
+    regressions = []
+    for phase, result in current['phases'].items():
+        base = baseline['phases'].get(phase)
+        if base is None:
+            continue
+
+        checks = [('rps', base['rps'], result['rps'], 'lower')]
+        for key in ('p50', 'p95', 'p99'):
+            checks.append((key, base['latency'][key], result['latency'][key], 'higher'))
+        if 'first_result_latency' in result and 'first_result_latency' in base:
+            checks.append(('first_result_p95', base['first_result_latency']['p95'],
+                           result['first_result_latency']['p95'], 'higher'))
+        checks.append(('error_rate', base['error_rate'], result['error_rate'], 'higher'))
+
+        for metric, before, after, worse in checks:
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            if metric == 'rps':
+                regressed = -change > thresholds['throughput']
+            elif metric == 'error_rate':
+                regressed = after - before > thresholds['error_rate']
+            else:
+                regressed = change > thresholds['latency'] and after - before > thresholds['latency_floor']
+            rows.append((phase, metric, before, after, change, regressed))
+            if regressed:
+                regressions.append(f'{phase} {metric}: {before} -> {after} ({change:+.1%})')
+    return rows, regressions
+
+
+def format_seconds(value):
+    return '-' if value is None else f'{value * 1000:.1f}ms'
+
+
+def print_results(results):
+    print(f"{'phase':<15}{'reqs':>6}{'errs':>6}{'rps':>9}{'p50':>11}{'p95':>11}{'p99':>11}{'written':>11}{'rss':>9}")
+    for phase, result in results['phases'].items():
+        latency = result['latency']
+        print(f"{phase:<15}{result['requests']:>6}{result['errors']:>6}{result['rps']:>9.1f}"
+              f"{format_seconds(latency['p50']):>11}{format_seconds(latency['p95']):>11}"
+              f"{format_seconds(latency['p99']):>11}{result['bytes_written'] / 1024 / 1024:>9.1f}MB"
+              f"{result['memory']['rss_mb'] or 0:>7.0f}MB")
+        if 'first_result_latency' in result:
+            first = result['first_result_latency']
+            print(f"{'':<15}first result p50 {format_seconds(first['p50'])}, p95 {format_seconds(first['p95'])}")
+
+
+def parse_shapes(value):
+    shapes = {}
+    for part in value.split(','):
+        shape, _, weight = part.partition('=')
+        if shape not in ('json', 'fenced', 'garbage'):
+            raise argparse.ArgumentTypeError(f'unknown response shape: {shape}')
+        shapes[shape] = float(weight or 1)
+    return shapes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the image search API against a local fake Gemini model.')
+    parser.add_argument('--phases', default=','.join(PHASES), help='comma separated subset of ' + ', '.join(PHASES))
+    parser.add_argument('--images', type=int, default=40, help='number of generated images in the corpus')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--image-format', choices=('jpeg', 'png', 'mixed'), default='mixed')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=0, help='requests per phase (default: one per image)')
+    parser.add_argument('--warmup', type=int, default=5, help='unrecorded requests before each search phase')
+    parser.add_argument('--latency', type=float, default=0.8, help='mean fake model latency in seconds')
+    parser.add_argument('--latency-jitter', type=float, default=0.2, help='standard deviation as a share of the mean')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of model calls failing with 429/500/503')
+    parser.add_argument('--shapes', type=parse_shapes, default={'json': 1.0},
+                        help='weighted response shapes, e.g. json=0.8,fenced=0.15,garbage=0.05')
+    parser.add_argument('--gemini-rate-limit', type=float, default=1000.0,
+                        help='client side Gemini rate limit; keep it high to measure the app itself')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--workdir', help='keep uploads, cache and logs here instead of a temporary directory')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    parser.add_argument('--save-baseline', help='write the results as a baseline to this path')
+    parser.add_argument('--compare', help='compare against a baseline and exit 1 on regressions')
+    parser.add_argument('--max-latency-regression', type=float, default=0.15,
+                        help='allowed relative increase of p50/p95/p99')
+    parser.add_argument('--latency-floor-ms', type=float, default=2.0,
+                        help='latency increases below this many milliseconds never count as regressions')
+    parser.add_argument('--max-throughput-regression', type=float, default=0.10,
+                        help='allowed relative drop in requests per second')
+    parser.add_argument('--max-error-rate-increase', type=float, default=0.01,
+                        help='allowed absolute increase of the error rate')
+    args = parser.parse_args(argv)
+
+    args.phases = [phase.strip() for phase in args.phases.split(',') if phase.strip()]
+    unknown = set(args.phases) - set(PHASES)
+    if unknown:
+        parser.error(f"unknown phases: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    temporary = None if args.workdir else tempfile.TemporaryDirectory(prefix='imagesearch-bench-')
+    workdir = args.workdir or temporary.name
+    os.makedirs(workdir, exist_ok=True)
+
+    benchmark = Benchmark(args, workdir)
+    try:
+        phases = {}
+        for phase in args.phases:
+            phases[phase] = benchmark.run_phase(phase)
+    finally:
+        benchmark.close()
+
+    results = {
+        'version': 1,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': benchmark_config(args),
+        'model': {
+            'calls': benchmark.model.calls,
+            'errors': benchmark.model.errors,
+            'shapes': benchmark.model.shape_counts,
+        },
+        'phases': phases,
+    }
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+            print(f'Results written to {path}')
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('config') != results['config']:
+            print('Warning: baseline was recorded with a different configuration; results may not be comparable')
+
+        rows, regressions = compare_results(results, baseline, {
+            'latency': args.max_latency_regression,
+            'latency_floor': args.latency_floor_ms / 1000,
+            'throughput': args.max_throughput_regression,
+            'error_rate': args.max_error_rate_increase,
+        })
+        print(f"\n{'phase':<15}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>9}")
+        for phase, metric, before, after, change, regressed in rows:
+            print(f"{phase:<15}{metric:<18}{before:>12.4f}{after:>12.4f}{change:>+9.1%}"
+                  f"{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) against {args.compare}')
+            exit_code = 1
+        else:
+            print(f'\nNo regressions against {args.compare}')
+
+    if temporary is not None:
+        temporary.cleanup()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,462 @@
+import time
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    pass
+
+
+class GeminiTimeoutError(GeminiError):
+    pass
+
+
+class GeminiRateLimitedError(GeminiError):
+    pass
+
+
+class CircuitOpenError(GeminiError):
+    pass
+
+
+def error_status_code(error):
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    # grpc style errors expose the status as a method
+    if callable(code):
+        try:
+            return getattr(code(), 'value', (None,))[0]
+        except Exception:
+            return None
+    return None
+
+
+class AdaptiveTokenBucket:
+    # AIMD: halve the rate on 429s, creep back up by 5% of the ceiling per success
+    def __init__(self, rate, burst, min_rate=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                delay = (1 - self.tokens) / self.rate
+
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def on_throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class RetryBudget:
+    # Each call earns `ratio` of a retry, so retries stay a bounded share of traffic
+    def __init__(self, ratio=0.2, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0
+            return max(0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class LatencyTracker:
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class GeminiClient:
+    def __init__(self, model_factory, timeout=30.0, rate_limit=5.0, burst=10, max_attempts=3,
+                 retry_budget=0.2, backoff_base=0.5, backoff_max=8.0, hedge=False,
+                 hedge_percentile=95, breaker_threshold=5, breaker_reset=30.0, max_workers=16):
+        self.model = model_factory()
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.limiter = AdaptiveTokenBucket(rate_limit, burst)
+        self.retry_budget = RetryBudget(retry_budget)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gemini')
+        self._counters = {
+            'calls': 0, 'successes': 0, 'failures': 0, 'retries': 0,
+            'hedges': 0, 'timeouts': 0, 'throttled': 0, 'rejected': 0,
+        }
+        self._counters_lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError('Gemini circuit breaker is open')
+
+        deadline = time.monotonic() + self.timeout
+        self.retry_budget.deposit()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            if not self.limiter.acquire(deadline):
+                self._count('rejected')
+                self.breaker.release()
+                raise GeminiRateLimitedError('Gemini rate limit leaves no time before the deadline')
+
+            try:
+                response = self._attempt(contents, kwargs, deadline)
+            except Exception as e:
+                status_code = error_status_code(e)
+                if status_code == 429:
+                    self._count('throttled')
+                    self.limiter.on_throttled()
+
+                retryable = isinstance(e, GeminiTimeoutError) or status_code in RETRYABLE_STATUS_CODES
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+
+                if (not retryable or attempt >= self.max_attempts or self.breaker.state == 'open'
+                        or not self.retry_budget.withdraw()):
+                    self._count('failures')
+                    raise
+
+                # Full jitter keeps synchronized clients from retrying in lockstep
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                if time.monotonic() + delay >= deadline:
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                time.sleep(delay)
+                continue
+
+            self.limiter.on_success()
+            self.breaker.record_success()
+            self._count('successes')
+            return response
+
+    def stream_content(self, contents, **kwargs):
+        # Yields text chunks as they arrive. Retries are only possible before the first chunk
+        # reaches the caller; after that a failure surfaces mid-stream.
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError('Gemini circuit breaker is open')
+
+        deadline = time.monotonic() + self.timeout
+        self.retry_budget.deposit()
+        attempt = 0
+        streamed = False
+
+        while True:
+            attempt += 1
+            if not self.limiter.acquire(deadline):
+                self._count('rejected')
+                self.breaker.release()
+                raise GeminiRateLimitedError('Gemini rate limit leaves no time before the deadline')
+
+            chunks = queue.Queue()
+            cancelled = threading.Event()
+            producer = self._executor.submit(self._produce_stream, contents, kwargs, chunks, cancelled, deadline)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        kind, value = chunks.get(timeout=max(0, remaining))
+                    except queue.Empty:
+                        self._count('timeouts')
+                        raise GeminiTimeoutError(f'Gemini stream exceeded {self.timeout}s deadline')
+                    if kind == 'error':
+                        if isinstance(value, GeminiTimeoutError):
+                            self._count('timeouts')
+                        raise value
+                    if kind == 'done':
+                        break
+                    streamed = True
+                    yield value
+            except GeneratorExit:
+                cancelled.set()
+                producer.cancel()
+                self.breaker.release()
+                raise
+            except Exception as e:
+                cancelled.set()
+                producer.cancel()
+                status_code = error_status_code(e)
+                if status_code == 429:
+                    self._count('throttled')
+                    self.limiter.on_throttled()
+
+                retryable = isinstance(e, GeminiTimeoutError) or status_code in RETRYABLE_STATUS_CODES
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+
+                if (streamed or not retryable or attempt >= self.max_attempts
+                        or self.breaker.state == 'open' or not self.retry_budget.withdraw()):
+                    self._count('failures')
+                    raise
+
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                if time.monotonic() + delay >= deadline:
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                time.sleep(delay)
+                continue
+
+            self.limiter.on_success()
+            self.breaker.record_success()
+            self._count('successes')
+            return
+
+    def _produce_stream(self, contents, kwargs, chunks, cancelled, deadline):
+        try:
+            request_kwargs = self._request_kwargs(kwargs, deadline)
+            if cancelled.is_set() or request_kwargs is None:
+                # The caller gave up while this call sat in the queue
+                return
+            for chunk in self.model.generate_content(contents, stream=True, **request_kwargs):
+                if cancelled.is_set():
+                    return
+                chunks.put(('chunk', chunk.text))
+            chunks.put(('done', None))
+        except Exception as e:
+            if time.monotonic() >= deadline:
+                e = GeminiTimeoutError(f'Gemini stream exceeded {self.timeout}s deadline')
+            chunks.put(('error', e))
+
+    def _attempt(self, contents, kwargs, deadline):
+        pending = {self._submit(contents, kwargs, deadline)}
+        hedge_delay = self.latency.percentile(self.hedge_percentile) if self.hedge else None
+        hedged = False
+        last_error = None
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            timeout = remaining
+            if hedge_delay is not None and not hedged:
+                timeout = min(remaining, hedge_delay)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    return future.result()
+                last_error = error
+
+            # Hedge once, and only when the slow call is still running and a token is free
+            if not done and hedge_delay is not None and not hedged:
+                hedged = True
+                if self.limiter.try_acquire():
+                    self._count('hedges')
+                    pending.add(self._submit(contents, kwargs, deadline))
+
+        if last_error is not None and not pending:
+            if isinstance(last_error, GeminiTimeoutError):
+                self._count('timeouts')
+            raise last_error
+        # Calls still queued would otherwise reach Gemini after the caller has given up
+        for future in pending:
+            future.cancel()
+        self._count('timeouts')
+        raise GeminiTimeoutError(f'Gemini call exceeded {self.timeout}s deadline')
+
+    def _submit(self, contents, kwargs, deadline):
+        def call():
+            request_kwargs = self._request_kwargs(kwargs, deadline)
+            if request_kwargs is None:
+                raise GeminiTimeoutError(f'Gemini call exceeded {self.timeout}s deadline before it started')
+            started_at = time.monotonic()
+            try:
+                response = self.model.generate_content(contents, **request_kwargs)
+            except Exception as e:
+                # The SDK timing out at the deadline is the same outcome as our own deadline
+                if time.monotonic() >= deadline:
+                    raise GeminiTimeoutError(f'Gemini call exceeded {self.timeout}s deadline') from e
+                raise
+            self.latency.record(time.monotonic() - started_at)
+            return response
+
+        return self._executor.submit(call)
+
+    def _request_kwargs(self, kwargs, deadline):
+        # The SDK call gets the time left as its own timeout, so it cannot outlive the deadline.
+        # None means the deadline has already passed and the call should not be made.
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        request_options = dict(kwargs.get('request_options') or {})
+        request_options['timeout'] = min(remaining, request_options.get('timeout', remaining))
+        return dict(kwargs, request_options=request_options)
+
+    def stats(self):
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['rate_limit'] = round(self.limiter.rate, 3)
+        stats['circuit_state'] = self.breaker.state
+        stats['circuit_trips'] = self.breaker.trips
+        stats['latency_p95'] = self.latency.percentile(95)
+        return stats
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code, message='Fake Gemini API error'):
+        super().__init__(f'{code} {message}')
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    def __init__(self, text='{"product_name": "Test ürünü"}', latency=0.0, errors=None,
+                 chunk_size=16, chunk_latency=0.0):
+        self.text = text
+        self.latency = latency
+        self.errors = deque(errors or [])
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        with self._lock:
+            self.calls += 1
+            error = self.errors.popleft() if self.errors else None
+
+        # Like the SDK, give up once request_options' timeout runs out
+        timeout = (kwargs.get('request_options') or {}).get('timeout')
+        if self.latency:
+            time.sleep(self.latency if timeout is None else min(self.latency, timeout))
+            if timeout is not None and self.latency > timeout:
+                raise FakeAPIError(504, 'Deadline exceeded')
+        if error is not None:
+            raise error
+        if kwargs.get('stream'):
+            return self._stream_chunks()
+        return FakeResponse(self.text)
+
+    def _stream_chunks(self):
+        for start in range(0, len(self.text), self.chunk_size):
+            if start and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield FakeResponse(self.text[start:start + self.chunk_size])
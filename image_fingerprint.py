@@ -0,0 +1,162 @@
+import io
+import threading
+from collections import defaultdict
+from PIL import Image
+from analysis_cache import connect_sqlite
+
+HASH_BITS = 64
+
+
+def compute_dhash(image_source, hash_size=8):
+    if isinstance(image_source, (bytes, bytearray)):
+        image_source = io.BytesIO(image_source)
+
+    with Image.open(image_source) as image:
+        image.draft('L', (hash_size * 16, hash_size * 16))
+        grayscale = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = list(grayscale.getdata())
+
+    fingerprint = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            fingerprint = (fingerprint << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return fingerprint
+
+
+def hamming_distance(left, right):
+    return (left ^ right).bit_count()
+
+
+class FingerprintIndex:
+    # Multi-index hashing: the 64-bit fingerprint is split into chunks, each with its
+    # own exact-match table. Two fingerprints within distance r share at least one
+    # chunk within distance r // chunk_count, so only those buckets are scanned.
+    def __init__(self, db_path=None, chunk_count=4):
+        self.chunk_count = chunk_count
+        self.chunk_bits = HASH_BITS // chunk_count
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.max_supported_distance = 3 * chunk_count - 1
+        self._tables = [defaultdict(set) for _ in range(chunk_count)]
+        self._file_hashes = defaultdict(set)
+        self._fingerprints = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.db_path = db_path
+
+        if db_path:
+            self.connection().execute("""
+                CREATE TABLE IF NOT EXISTS image_fingerprints (
+                    file_hash TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL
+                )
+            """)
+            self.connection().commit()
+            self.load()
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = connect_sqlite(self.db_path)
+            self._local.connection = connection
+        return connection
+
+    def load(self):
+        rows = self.connection().execute('SELECT file_hash, fingerprint FROM image_fingerprints').fetchall()
+        with self._lock:
+            for file_hash, fingerprint in rows:
+                self._insert(int(fingerprint, 16), file_hash)
+
+    def add(self, file_hash, fingerprint):
+        with self._lock:
+            previous = self._fingerprints.get(file_hash)
+            if previous == fingerprint:
+                return
+            if previous is not None:
+                self._discard(previous, file_hash)
+            self._insert(fingerprint, file_hash)
+
+        if self.db_path:
+            connection = self.connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO image_fingerprints (file_hash, fingerprint) VALUES (?, ?)',
+                (file_hash, format(fingerprint, '016x'))
+            )
+            connection.commit()
+
+    def remove(self, file_hashes):
+        removed = []
+        with self._lock:
+            for file_hash in file_hashes:
+                fingerprint = self._fingerprints.pop(file_hash, None)
+                if fingerprint is None:
+                    continue
+                removed.append(file_hash)
+                self._discard(fingerprint, file_hash)
+
+        if self.db_path and removed:
+            connection = self.connection()
+            connection.executemany(
+                'DELETE FROM image_fingerprints WHERE file_hash = ?', [(file_hash,) for file_hash in removed]
+            )
+            connection.commit()
+
+    def fingerprint_of(self, file_hash):
+        with self._lock:
+            return self._fingerprints.get(file_hash)
+
+    def nearest(self, fingerprint, max_distance):
+        if max_distance > self.max_supported_distance:
+            raise ValueError('Maximum distance is too large for the configured chunk count')
+
+        chunk_radius = max_distance // self.chunk_count
+        candidates = set()
+
+        with self._lock:
+            for index, table in enumerate(self._tables):
+                chunk = self._chunk(fingerprint, index)
+                for neighbour in self._neighbours(chunk, chunk_radius):
+                    candidates.update(table.get(neighbour, ()))
+
+            matches = []
+            for candidate in candidates:
+                distance = hamming_distance(fingerprint, candidate)
+                if distance <= max_distance:
+                    matches.extend((distance, file_hash) for file_hash in self._file_hashes[candidate])
+
+        matches.sort()
+        return matches
+
+    def __len__(self):
+        return sum(len(file_hashes) for file_hashes in self._file_hashes.values())
+
+    def _insert(self, fingerprint, file_hash):
+        if fingerprint not in self._file_hashes:
+            for index, table in enumerate(self._tables):
+                table[self._chunk(fingerprint, index)].add(fingerprint)
+        self._file_hashes[fingerprint].add(file_hash)
+        self._fingerprints[file_hash] = fingerprint
+
+    def _discard(self, fingerprint, file_hash):
+        owners = self._file_hashes[fingerprint]
+        owners.discard(file_hash)
+        if not owners:
+            del self._file_hashes[fingerprint]
+            for index, table in enumerate(self._tables):
+                chunk = self._chunk(fingerprint, index)
+                table[chunk].discard(fingerprint)
+                if not table[chunk]:
+                    del table[chunk]
+
+    def _chunk(self, fingerprint, index):
+        return (fingerprint >> (index * self.chunk_bits)) & self.chunk_mask
+
+    def _neighbours(self, chunk, radius):
+        yield chunk
+        if radius >= 1:
+            for bit in range(self.chunk_bits):
+                yield chunk ^ (1 << bit)
+        if radius >= 2:
+            for first in range(self.chunk_bits):
+                for second in range(first + 1, self.chunk_bits):
+                    yield chunk ^ (1 << first) ^ (1 << second)
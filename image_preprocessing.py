@@ -0,0 +1,96 @@
+import io
+import threading
+from collections import OrderedDict, namedtuple
+from PIL import Image, ImageOps
+
+PreparedImage = namedtuple('PreparedImage', ['data', 'mime_type', 'width', 'height', 'original_size'])
+
+MAGIC_MIME_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+PILLOW_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+# Formats the model accepts as-is; anything else is always re-encoded
+PASSTHROUGH_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+
+
+def sniff_mime_type(header):
+    for magic, mime_type in MAGIC_MIME_TYPES:
+        if header.startswith(magic):
+            return mime_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class ImagePreprocessor:
+    def __init__(self, max_edge=1024, jpeg_quality=85, cache_entries=256):
+        self.max_edge = max_edge
+        self.jpeg_quality = jpeg_quality
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prepare(self, image_data, file_hash=None):
+        if file_hash is not None:
+            with self._lock:
+                prepared = self._cache.get(file_hash)
+                if prepared is not None:
+                    self._cache.move_to_end(file_hash)
+                    return prepared
+
+        try:
+            prepared = self._process(image_data)
+        except Exception:
+            # Let the model see the original bytes rather than failing the search
+            prepared = PreparedImage(image_data, sniff_mime_type(image_data[:16]) or 'image/jpeg',
+                                     None, None, len(image_data))
+
+        if file_hash is not None and self.cache_entries > 0:
+            with self._lock:
+                self._cache[file_hash] = prepared
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return prepared
+
+    def _process(self, image_data):
+        with Image.open(io.BytesIO(image_data)) as image:
+            source_mime_type = PILLOW_MIME_TYPES.get(image.format)
+            orientation = image.getexif().get(0x0112, 1)
+            animated = getattr(image, 'is_animated', False)
+
+            if (source_mime_type in PASSTHROUGH_MIME_TYPES and orientation == 1 and not animated
+                    and max(image.size) <= self.max_edge):
+                return PreparedImage(image_data, source_mime_type, image.width, image.height, len(image_data))
+
+            if image.format == 'JPEG':
+                # Let libjpeg downscale by 1/2, 1/4 or 1/8 while decoding
+                image.draft('RGB', (self.max_edge, self.max_edge))
+
+            if animated:
+                image.seek(0)
+
+            frame = ImageOps.exif_transpose(image)
+            has_alpha = frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info
+            frame = frame.convert('RGBA' if has_alpha else 'RGB')
+            frame.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+
+            output = io.BytesIO()
+            if has_alpha:
+                frame.save(output, format='WEBP', quality=self.jpeg_quality, method=4)
+                mime_type = 'image/webp'
+            else:
+                frame.save(output, format='JPEG', quality=self.jpeg_quality, optimize=True)
+                mime_type = 'image/jpeg'
+
+            data = output.getvalue()
+            return PreparedImage(data, mime_type, frame.width, frame.height, len(image_data))
@@ -0,0 +1,169 @@
+import re
+import time
+import html
+import threading
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from analysis_cache import MemoryLRU
+
+ProbeResult = namedtuple('ProbeResult', ['count', 'listings'])
+
+ADAPTERS = {}
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; TuringHiveProbe/1.0)',
+    'Accept': 'text/html,application/json;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'tr-TR,tr;q=0.9',
+}
+
+
+def normalize_query(text):
+    # str.lower() maps 'I' to 'i' and 'İ' to 'i̇'; Turkish expects 'ı' and 'i'
+    text = text.replace('I', 'ı').replace('İ', 'i').lower()
+    return ' '.join(text.split())
+
+
+def register_adapter(name):
+    def decorator(cls):
+        ADAPTERS[name] = cls
+        return cls
+    return decorator
+
+
+def parse_count(value):
+    digits = re.sub(r'[^\d]', '', value)
+    return int(digits) if digits else 0
+
+
+@register_adapter('regex')
+class RegexAdapter:
+    def __init__(self, marketplace, session, timeout, count_pattern, listing_pattern=None,
+                 max_listings=3, base_url=None):
+        self.marketplace = marketplace
+        self.session = session
+        self.timeout = timeout
+        self.count_pattern = re.compile(count_pattern)
+        self.listing_pattern = re.compile(listing_pattern) if listing_pattern else None
+        self.max_listings = max_listings
+        self.base_url = base_url
+
+    def url(self, encoded_query):
+        prefix, suffix = self.marketplace.search_url_parts
+        url = prefix if suffix is None else prefix + encoded_query + suffix
+        if self.base_url:
+            # Local stand-ins serve every marketplace from one host, namespaced by id
+            parsed = urllib.parse.urlsplit(url)
+            path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+            url = f"{self.base_url.rstrip('/')}/{self.marketplace.id}{path}"
+        return url
+
+    def fetch(self, encoded_query):
+        response = self.session.get(self.url(encoded_query), timeout=self.timeout)
+        response.raise_for_status()
+        return self.parse(response.text)
+
+    def parse(self, text):
+        # No match means the page layout is unknown to us, not that there are no results
+        match = self.count_pattern.search(text)
+        count = parse_count(match.group(1)) if match else None
+
+        listings = []
+        if self.listing_pattern is not None:
+            for listing in self.listing_pattern.finditer(text):
+                listings.append({
+                    'title': html.unescape(listing.group('title')).strip(),
+                    'url': urllib.parse.urljoin(self.marketplace.url, html.unescape(listing.group('url')))
+                })
+                if len(listings) >= self.max_listings:
+                    break
+        return ProbeResult(count, listings)
+
+
+class MarketplaceProber:
+    def __init__(self, registry, default_timeout=2.5, max_workers=16, cache_ttl=900,
+                 cache_entries=5000, base_url=None, failure_ttl=60):
+        self.cache_ttl = cache_ttl
+        self.failure_ttl = failure_ttl
+        self.cache = MemoryLRU(max_entries=cache_entries, max_bytes=cache_entries)
+        self.adapters = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='probe')
+        # probe() blocks on the fetch pool, so background probes need a pool of their own
+        self._background = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='probe-background')
+        self._sessions = {}
+        self._stats_lock = threading.Lock()
+        self.stats_counters = {'cache_hits': 0, 'fetches': 0, 'failures': 0, 'timeouts': 0}
+
+        for marketplace in registry:
+            probe = marketplace.definition.get('probe')
+            if not probe:
+                continue
+
+            options = dict(probe)
+            adapter_class = ADAPTERS[options.pop('adapter', 'regex')]
+            timeout = options.pop('timeout', default_timeout)
+            self.adapters[marketplace.id] = adapter_class(
+                marketplace, self.session_for(marketplace.url, max_workers), timeout,
+                base_url=base_url, **options
+            )
+        self.deadline = max((adapter.timeout for adapter in self.adapters.values()), default=0)
+
+    def session_for(self, url, pool_size):
+        # One pooled session per host keeps TLS connections warm across searches
+        host = urllib.parse.urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            self._sessions[host] = session
+        return session
+
+    def probe(self, product_name, encoded_query):
+        query_key = normalize_query(product_name)
+        results = {}
+        futures = {}
+
+        for marketplace_id, adapter in self.adapters.items():
+            cached = self.cache.get((marketplace_id, query_key))
+            if cached is not None:
+                results[marketplace_id] = cached
+            else:
+                futures[self._executor.submit(adapter.fetch, encoded_query)] = marketplace_id
+
+        if futures:
+            # Total latency is bounded by the slowest adapter's deadline, not their sum
+            deadline = max(self.adapters[marketplace_id].timeout for marketplace_id in futures.values())
+            done, not_done = wait(futures, timeout=deadline)
+            now = time.time()
+            failures = 0
+            for future, marketplace_id in futures.items():
+                if future in done and future.exception() is None:
+                    result = future.result()
+                    expires_at = now + self.cache_ttl
+                else:
+                    # Remember failures briefly so a broken marketplace is not hit on every search
+                    failures += future in done
+                    result = ProbeResult(None, [])
+                    expires_at = now + self.failure_ttl
+                results[marketplace_id] = result
+                self.cache.set((marketplace_id, query_key), result, 1, expires_at)
+            self._count(fetches=len(futures), failures=failures, timeouts=len(not_done))
+
+        self._count(cache_hits=len(self.adapters) - len(futures))
+        return results
+
+    def probe_in_background(self, product_name, encoded_query):
+        return self._background.submit(self.probe, product_name, encoded_query)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.stats_counters, adapters=len(self.adapters), cached_queries=len(self.cache))
+
+    def _count(self, **amounts):
+        with self._stats_lock:
+            for name, amount in amounts.items():
+                self.stats_counters[name] += amount
@@ -0,0 +1,101 @@
+import time
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned search pages carrying the markup each probe pattern in marketplaces.json looks for
+CANNED_PAGES = {
+    'trendyol_search': '<script>window.__SEARCH_APP_INITIAL_STATE__={"totalCount":1284,"products":[]}</script>',
+    'hepsiburada_search': '<script type="application/json">{"totalProductCount": 532}</script>',
+    'n11_search': '<script>var searchResult = {"totalResultCount": 87};</script>',
+    'amazon_tr_search': '<div data-search-metadata=\'{"totalResultCount": 3000}\'></div>',
+    'ciceksepeti_search': '<script>{"totalCount":0,"items":[]}</script>',
+    'vatanbilgisayar_search': '<div class="wrapper-detailpage-header__text">1.284 ürün listeleniyor</div>',
+    'teknosa_search': '<script>dataLayer.push({"totalNumberOfResults": 41});</script>',
+    'media_markt_search': '<script>{"totalProducts": 19}</script>',
+    'dolap_search': '<script>{"totalCount": 6}</script>',
+}
+
+
+class MarketplaceStandIn:
+    # Serves canned search pages under /<marketplace id>/<original path>, the layout RegexAdapter
+    # requests when MARKETPLACE_PROBE_BASE_URL is set, so probing runs without the real sites.
+    def __init__(self, pages=None, delays=None, host='127.0.0.1', port=0):
+        self.pages = dict(CANNED_PAGES if pages is None else pages)
+        self.delays = dict(delays or {})
+        self.requests = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='marketplace-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                marketplace_id, _, rest = self.path.lstrip('/').partition('/')
+                with standin._lock:
+                    standin.requests.append((marketplace_id, urllib.parse.unquote('/' + rest)))
+
+                delay = standin.delays.get(marketplace_id)
+                if delay:
+                    time.sleep(delay)
+
+                page = standin.pages.get(marketplace_id)
+                body = (page if page is not None else 'Not found').encode('utf-8')
+                self.send_response(200 if page is not None else 404)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The prober gave up on a slow page
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve canned marketplace search pages for probe development')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    standin = MarketplaceStandIn(host=args.host, port=args.port)
+    print(f"Set MARKETPLACE_PROBE_BASE_URL={standin.base_url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
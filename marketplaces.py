@@ -0,0 +1,81 @@
+import os
+import json
+import hashlib
+import mimetypes
+import urllib.parse
+from collections import namedtuple
+
+Marketplace = namedtuple('Marketplace', [
+    'id', 'name', 'url', 'logo',
+    'search_url_parts', 'description_parts', 'definition'
+])
+
+MarketplaceLogo = namedtuple('MarketplaceLogo', ['data', 'mimetype', 'etag'])
+
+
+def split_template(template, placeholder):
+    # Templates hold one placeholder; splitting once turns each render into string concatenation
+    prefix, found, suffix = template.partition(placeholder)
+    return (prefix, suffix) if found else (prefix, None)
+
+
+def render_template(parts, value):
+    prefix, suffix = parts
+    return prefix if suffix is None else prefix + value + suffix
+
+
+class MarketplaceRegistry:
+    def __init__(self, config_path, logo_dir, logo_url_prefix='/api/marketplaces'):
+        self.logos = {}
+        marketplaces = []
+
+        with open(config_path, encoding='utf-8') as config_file:
+            definitions = json.load(config_file)['marketplaces']
+
+        for definition in definitions:
+            logo = definition['logo']
+            if not logo.startswith(('http://', 'https://')):
+                self.logos[definition['id']] = self.load_logo(os.path.join(logo_dir, logo))
+                etag = self.logos[definition['id']].etag
+                logo = f"{logo_url_prefix}/{definition['id']}/logo?v={etag[:12]}"
+
+            marketplaces.append(Marketplace(
+                id=definition['id'],
+                name=definition['name'],
+                url=definition['url'],
+                logo=logo,
+                search_url_parts=split_template(definition['search_url'], '{query}'),
+                description_parts=split_template(definition['description'], '{product_name}'),
+                definition=dict(definition, logo=logo)
+            ))
+
+        self.marketplaces = tuple(marketplaces)
+        self.by_id = {marketplace.id: marketplace for marketplace in self.marketplaces}
+        self.public_definitions = [
+            {key: value for key, value in marketplace.definition.items() if key != 'probe'}
+            for marketplace in self.marketplaces
+        ]
+        self.etag = hashlib.sha1(
+            json.dumps(self.public_definitions, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def load_logo(self, path):
+        with open(path, 'rb') as logo_file:
+            data = logo_file.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return MarketplaceLogo(data, mimetype, hashlib.sha1(data).hexdigest())
+
+    def __iter__(self):
+        return iter(self.marketplaces)
+
+    def __len__(self):
+        return len(self.marketplaces)
+
+    def encode_query(self, product_name):
+        return urllib.parse.quote(product_name)
+
+    def search_url(self, marketplace, encoded_query):
+        return render_template(marketplace.search_url_parts, encoded_query)
+
+    def description(self, marketplace, product_name):
+        return render_template(marketplace.description_parts, product_name)
@@ -0,0 +1,220 @@
+import time
+import random
+import bisect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type_name = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+
+
+class Histogram:
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts plus the +Inf bucket, then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        labelnames = self.labelnames + ('le',)
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{format_labels(labelnames, key + (format_value(bound),))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(round(total, 6))}"
+            yield f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}"
+
+
+class Gauge:
+    # Read at scrape time from state the app already keeps, so nothing has to update it
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            value = None
+        if value is not None:
+            yield f"{self.name} {format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, function):
+        return self._register(Gauge(name, help_text, function))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'spans': [
+                {'stage': stage, 'offset': round(offset, 6), 'duration': round(duration, 6)}
+                for stage, offset, duration in self.spans
+            ]
+        }
+
+
+class Tracer:
+    def __init__(self, registry, slow_threshold=2.0, sample_rate=0.1, max_traces=100):
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.stage_seconds = registry.histogram(
+            'imagesearch_stage_duration_seconds', 'Time spent in each stage of a request', ('trace', 'stage')
+        )
+        self.trace_seconds = registry.histogram(
+            'imagesearch_trace_duration_seconds', 'Total time of traced requests and jobs', ('trace',)
+        )
+        self._slow_traces = deque(maxlen=max_traces)
+        self._local = threading.local()
+
+    def start(self, name):
+        trace = Trace(name)
+        self._local.trace = trace
+        return trace
+
+    def finish(self, trace, **details):
+        # Returns the trace duration; slow traces are kept for inspection at the sample rate
+        self._local.trace = None
+        duration = time.perf_counter() - trace.started
+        self.trace_seconds.observe(duration, trace=trace.name)
+
+        if duration >= self.slow_threshold and random.random() < self.sample_rate:
+            record = dict(trace.to_dict(), duration=round(duration, 6), **details)
+            self._slow_traces.append(record)
+            stages = ', '.join(f"{span['stage']}={span['duration']:.3f}s" for span in record['spans'])
+            logger.warning(f"Slow {trace.name} took {duration:.3f}s: {stages}")
+        return duration
+
+    @contextmanager
+    def trace(self, name):
+        previous = getattr(self._local, 'trace', None)
+        trace = self.start(name)
+        try:
+            yield trace
+        finally:
+            self.finish(trace)
+            self._local.trace = previous
+
+    def detach(self):
+        # Takes the current trace off this thread without finishing it
+        trace = getattr(self._local, 'trace', None)
+        self._local.trace = None
+        return trace
+
+    def bind(self, trace, function):
+        # Spans recorded while function runs on a pool thread land in trace instead of 'background'
+        def bound(*args, **kwargs):
+            previous = getattr(self._local, 'trace', None)
+            self._local.trace = trace
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._local.trace = previous
+        return bound
+
+    @contextmanager
+    def span(self, stage):
+        trace = getattr(self._local, 'trace', None)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            self.stage_seconds.observe(duration, trace=trace.name if trace else 'background', stage=stage)
+            if trace is not None:
+                trace.spans.append((stage, started - trace.started, duration))
+
+    def slow_traces(self):
+        return list(self._slow_traces)
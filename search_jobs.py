@@ -0,0 +1,150 @@
+import math
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Search queue is full')
+        self.retry_after = retry_after
+
+
+class SearchJob:
+    def __init__(self, key, fn):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.fn = fn
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+        self._condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed')
+
+    def update(self, status, result=None, error=None):
+        with self._condition:
+            self.status = status
+            if status == 'running':
+                self.started_at = time.time()
+            elif status in ('completed', 'failed'):
+                self.finished_at = time.time()
+                self.result = result
+                self.error = error
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def wait(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: self.done, timeout)
+
+    def to_dict(self):
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == 'completed':
+            job['result'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+class SearchJobManager:
+    def __init__(self, worker_count=4, max_queue=32, job_ttl=600):
+        self.worker_count = worker_count
+        self.job_ttl = job_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._inflight = {}
+        self._durations = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.rejected = 0
+
+        for index in range(worker_count):
+            worker = threading.Thread(target=self._work, name=f'search-worker-{index}', daemon=True)
+            worker.start()
+
+    def submit(self, key, fn):
+        with self._lock:
+            self._prune()
+
+            # Singleflight: callers asking for the same key share the in-flight job
+            job = self._inflight.get(key)
+            if job is not None:
+                self.coalesced += 1
+                return job, True
+
+            job = SearchJob(key, fn)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFullError(self._retry_after())
+
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.worker_count,
+                'queue_depth': self._queue.qsize(),
+                'queue_limit': self._queue.maxsize,
+                'in_flight': len(self._inflight),
+                'tracked_jobs': len(self._jobs),
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+            }
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.update('running')
+            try:
+                job.update('completed', result=job.fn())
+            except Exception as e:
+                job.update('failed', error=str(e))
+            finally:
+                with self._lock:
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                    self._durations.append(job.finished_at - job.started_at)
+                self._queue.task_done()
+
+    def _retry_after(self):
+        average = sum(self._durations) / len(self._durations) if self._durations else 5.0
+        # In-flight jobs cover both the queued and the running ones
+        backlog = len(self._inflight)
+        return max(1, math.ceil(backlog * average / self.worker_count))
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
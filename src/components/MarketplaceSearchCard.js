@@ -177,10 +177,12 @@ const MarketplaceSearchCard = ({ marketplace }) => {
         {marketplace.description}
       </MarketplaceDescription>
       
-      <EstimatedResults>
-        <FaSearch />
-        ~{marketplace.estimated_results} tahmini sonuç
-      </EstimatedResults>
+      {marketplace.estimated_results != null && (
+        <EstimatedResults>
+          <FaSearch />
+          {marketplace.estimated_results} sonuç
+        </EstimatedResults>
+      )}
       
       <SearchButton>
         <FaExternalLinkAlt />
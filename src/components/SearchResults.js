@@ -226,7 +226,11 @@ const SearchResults = ({ results, productInfo }) => {
   
   const getStats = () => {
     const totalMarketplaces = marketplaceSearches.length;
-    const totalEstimatedResults = marketplaceSearches.reduce((sum, mp) => sum + (mp.estimated_results || 0), 0);
+    // Counts are null when probing is off or failed; only known counts are summed
+    const knownCounts = marketplaceSearches.filter((mp) => mp.estimated_results != null);
+    const totalEstimatedResults = knownCounts.length > 0
+      ? knownCounts.reduce((sum, mp) => sum + mp.estimated_results, 0)
+      : null;
     const productName = productInfo?.product_name || 'Bilinmeyen Ürün';
     
     return {
@@ -260,10 +264,12 @@ const SearchResults = ({ results, productInfo }) => {
             <StatNumber>{stats.totalMarketplaces}</StatNumber>
             <StatLabel>Pazaryeri</StatLabel>
           </StatCard>
-          <StatCard>
-            <StatNumber>{stats.totalEstimatedResults.toLocaleString()}</StatNumber>
-            <StatLabel>Tahmini Sonuç</StatLabel>
-          </StatCard>
+          {stats.totalEstimatedResults != null && (
+            <StatCard>
+              <StatNumber>{stats.totalEstimatedResults.toLocaleString()}</StatNumber>
+              <StatLabel>Tahmini Sonuç</StatLabel>
+            </StatCard>
+          )}
           <StatCard>
             <StatNumber>{stats.productName}</StatNumber>
             <StatLabel>Bulunan Ürün</StatLabel>
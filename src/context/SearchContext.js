@@ -35,6 +35,8 @@ const searchReducer = (state, action) => {
         loadingStage: '',
         error: null
       };
+    case 'UPDATE_PRODUCT_INFO':
+      return { ...state, productInfo: { ...state.productInfo, ...action.payload } };
     case 'SET_FILTERS':
       return { ...state, filters: { ...state.filters, ...action.payload } };
     case 'CLEAR_RESULTS':
@@ -82,26 +84,58 @@ export const SearchProvider = ({ children }) => {
     }
   };
 
+  const streamSearch = (filename) => new Promise((resolve, reject) => {
+    // Marketplace links are shown as soon as the product name is known; the remaining
+    // product details fill in while the analysis is still being written
+    const source = new EventSource(`/api/search/stream?filename=${encodeURIComponent(filename)}`);
+    let productInfo = null;
+
+    source.addEventListener('product_name', (event) => {
+      productInfo = JSON.parse(event.data);
+      dispatch({ type: 'SET_LOADING_STAGE', payload: 'Ürün tanındı, pazar yerleri hazırlanıyor...' });
+    });
+    source.addEventListener('marketplaces', (event) => {
+      dispatch({
+        type: 'SET_SEARCH_RESULTS',
+        payload: { results: JSON.parse(event.data), productInfo }
+      });
+    });
+    source.addEventListener('field', (event) => {
+      const { name, value } = JSON.parse(event.data);
+      dispatch({ type: 'UPDATE_PRODUCT_INFO', payload: { [name]: value } });
+    });
+    source.addEventListener('done', (event) => {
+      source.close();
+      resolve(JSON.parse(event.data));
+    });
+    source.addEventListener('error', (event) => {
+      source.close();
+      reject(new Error(event.data ? JSON.parse(event.data).error : 'Search failed'));
+    });
+  });
+
   const searchProducts = async (filename) => {
     try {
       dispatch({ type: 'SET_LOADING', payload: true });
       dispatch({ type: 'SET_LOADING_STAGE', payload: 'Yapay zeka ile ürün analiz ediliyor...' });
       dispatch({ type: 'SET_ERROR', payload: null });
 
-      const response = await axios.post('/api/search', { filename });
+      const data = typeof EventSource !== 'undefined'
+        ? await streamSearch(filename)
+        : (await axios.post('/api/search', { filename })).data;
 
-      if (response.data.success) {
+      if (data.success) {
         dispatch({ type: 'SET_LOADING_STAGE', payload: 'Sonuçlar derleniyor...' });
         dispatch({ 
           type: 'SET_SEARCH_RESULTS', 
           payload: {
-            results: response.data.marketplace_results,
-            productInfo: response.data.product_info
+            results: data.marketplace_results,
+            productInfo: data.product_info
           }
         });
-        return response.data;
+        return data;
       } else {
-        throw new Error(response.data.error || 'Search failed');
+        throw new Error(data.error || 'Search failed');
       }
     } catch (error) {
       const errorMessage = error.response?.data?.error || error.message || 'Search failed';
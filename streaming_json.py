@@ -0,0 +1,93 @@
+import re
+import json
+
+# An opening fence with an optional language tag, on its own line or straight before the content
+CODE_FENCE_OPEN = re.compile(r'^```[\w+-]*[ \t]*\n?')
+
+
+def strip_code_fences(text):
+    text = text.strip()
+    if text.startswith('```'):
+        text = CODE_FENCE_OPEN.sub('', text, count=1)
+        if text.rstrip().endswith('```'):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+class IncrementalObjectParser:
+    # Scans a streamed JSON object and reports each top-level field as soon as its value is
+    # complete. Anything before the first '{' (Markdown fences, prose) is skipped.
+    def __init__(self):
+        self.buffer = ''
+        self.fields = {}
+        self.complete = False
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+
+        while self._position < len(self.buffer) and not self.complete:
+            index = self._position
+            char = self.buffer[index]
+            self._position += 1
+
+            if not self._started:
+                if char == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(self.buffer[self._key_start:index + 1])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start is None:
+                    self._key_start = index
+                elif self._depth == 1 and self._value_start is None:
+                    self._value_start = index
+            elif char in '{[':
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = index
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_field(index, completed)
+                    self.complete = True
+            elif self._depth == 1:
+                if char == ',':
+                    self._finish_field(index, completed)
+                elif char not in ': \t\r\n' and self._key is not None and self._value_start is None:
+                    self._value_start = index
+
+        return completed
+
+    def _finish_field(self, end, completed):
+        if self._key is not None and self._value_start is not None:
+            try:
+                value = json.loads(self.buffer[self._value_start:end])
+            except json.JSONDecodeError:
+                value = None
+            else:
+                self.fields[self._key] = value
+                completed.append((self._key, value))
+        self._key = None
+        self._key_start = None
+        self._value_start = None
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def image_search_app(tmp_path_factory):
+    # The app is built at import time; its files go to a temp directory instead of the checkout
+    root = tmp_path_factory.mktemp('app')
+    os.environ.update({
+        'UPLOAD_FOLDER': str(root / 'uploads'),
+        'LOG_FILE': str(root / 'app.log'),
+        'ANALYSIS_CACHE_PATH': str(root / 'analysis.sqlite3'),
+        'MARKETPLACE_PROBE_ENABLED': 'false',
+    })
+    import app
+    return app.app_instance
@@ -0,0 +1,45 @@
+import io
+import json
+import time
+
+import pytest
+from PIL import Image
+
+from gemini_client import FakeGenerativeModel, GeminiClient
+
+
+@pytest.fixture
+def client(image_search_app, monkeypatch):
+    model = FakeGenerativeModel(text='{"product_name": "Kahve Kupası"}', latency=0.5)
+    monkeypatch.setattr(image_search_app, 'gemini_client', GeminiClient(lambda: model))
+    return image_search_app.app.test_client()
+
+
+def upload(client):
+    image = io.BytesIO()
+    Image.effect_noise((300, 300), 60).convert('RGB').save(image, 'PNG')
+    image.seek(0)
+    return client.post('/api/upload', data={'image': (image, 'a.png')}).json['filename']
+
+
+def test_cache_hits_are_written_before_analyses_finish(client):
+    cached = upload(client)
+    assert client.post('/api/search', json={'filename': cached}).status_code == 200
+    filenames = [upload(client), upload(client), cached, 'missing.png']
+
+    started = time.monotonic()
+    response = client.post('/api/search/batch', json={'filenames': filenames}, buffered=False)
+    lines = []
+    for chunk in response.response:
+        lines.extend(json.loads(line) for line in chunk.decode('utf-8').splitlines())
+        if len(lines) == 1:
+            first_line_seconds = time.monotonic() - started
+    response.close()
+
+    assert first_line_seconds < 0.4
+    assert {line['filename'] for line in lines[:2]} == {cached, 'missing.png'}
+    by_filename = {line['filename']: line for line in lines if 'filename' in line}
+    assert by_filename[cached]['cached'] is True
+    assert by_filename['missing.png']['error'] == 'File not found'
+    assert all(by_filename[filename]['product_info']['product_name'] == 'Kahve Kupası' for filename in filenames[:2])
+    assert lines[-1] == {'summary': {'total': 4, 'succeeded': 3, 'failed': 1}}
@@ -0,0 +1,154 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gemini_client import (
+    AdaptiveTokenBucket, CircuitBreaker, CircuitOpenError, FakeAPIError, FakeGenerativeModel,
+    GeminiClient, GeminiRateLimitedError, GeminiTimeoutError
+)
+
+
+class SequencedLatencyModel(FakeGenerativeModel):
+    # Each call sleeps for the next latency in line, so a hedge can beat a slow first call
+    def __init__(self, latencies, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = deque(latencies)
+
+    def generate_content(self, contents, **kwargs):
+        with self._lock:
+            delay = self.latencies.popleft() if self.latencies else 0.0
+        time.sleep(delay)
+        return super().generate_content(contents, **kwargs)
+
+
+def make_client(model, **kwargs):
+    options = dict(backoff_base=0.001, backoff_max=0.002, breaker_threshold=100)
+    options.update(kwargs)
+    return GeminiClient(lambda: model, **options)
+
+
+def test_token_bucket_halves_rate_on_429_and_recovers():
+    model = FakeGenerativeModel(errors=[FakeAPIError(429)])
+    client = make_client(model, rate_limit=10, burst=10)
+
+    assert client.generate_content(['prompt']).text == model.text
+    stats = client.stats()
+    assert stats['throttled'] == 1
+    assert stats['retries'] == 1
+    # Halved to 5/s by the 429, then nudged up by 5% of the ceiling for the success
+    assert client.limiter.rate == pytest.approx(5.5)
+
+
+def test_token_bucket_rate_has_a_floor():
+    bucket = AdaptiveTokenBucket(rate=1, burst=1, min_rate=0.25)
+    for _ in range(5):
+        bucket.on_throttled()
+    assert bucket.rate == 0.25
+    assert bucket.tokens <= 0
+
+
+def test_retry_budget_exhaustion_stops_retries():
+    model = FakeGenerativeModel(errors=[FakeAPIError(503)] * 5)
+    client = make_client(model, max_attempts=5)
+    client.retry_budget.tokens = 1
+
+    with pytest.raises(FakeAPIError):
+        client.generate_content(['prompt'])
+    # The call's deposit plus the starting token pay for one retry only
+    assert model.calls == 2
+    assert client.stats()['retries'] == 1
+    assert client.stats()['failures'] == 1
+
+
+def test_call_is_cut_off_at_the_deadline():
+    model = FakeGenerativeModel(latency=0.5)
+    client = make_client(model, timeout=0.1, max_attempts=1)
+
+    started = time.monotonic()
+    with pytest.raises(GeminiTimeoutError):
+        client.generate_content(['prompt'])
+    assert time.monotonic() - started < 0.4
+    assert client.stats()['timeouts'] == 1
+
+
+def test_rate_limit_that_outlasts_the_deadline_fails_fast():
+    client = make_client(FakeGenerativeModel(), timeout=0.1, rate_limit=1, burst=1)
+    client.generate_content(['prompt'])
+
+    with pytest.raises(GeminiRateLimitedError):
+        client.generate_content(['prompt'])
+    assert client.stats()['rejected'] == 1
+
+
+def test_breaker_opens_then_half_opens_then_closes():
+    model = FakeGenerativeModel(errors=[FakeAPIError(503)] * 2)
+    client = make_client(model, max_attempts=1, breaker_threshold=2, breaker_reset=0.1)
+
+    for _ in range(2):
+        with pytest.raises(FakeAPIError):
+            client.generate_content(['prompt'])
+    assert client.breaker.state == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        client.generate_content(['prompt'])
+    assert model.calls == 2
+
+    time.sleep(0.15)
+    assert client.breaker.allow()
+    assert client.breaker.state == 'half_open'
+    # Only one trial call goes through while half open
+    assert not client.breaker.allow()
+    client.breaker.release()
+
+    assert client.generate_content(['prompt']).text == model.text
+    assert client.breaker.state == 'closed'
+    assert client.stats()['circuit_trips'] == 1
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_slow_call_is_hedged_once():
+    model = SequencedLatencyModel([0.0] * 20 + [1.0])
+    client = make_client(model, hedge=True, rate_limit=1000, burst=100)
+    for _ in range(20):
+        client.generate_content(['prompt'])
+
+    started = time.monotonic()
+    assert client.generate_content(['prompt']).text == model.text
+    assert time.monotonic() - started < 0.5
+    assert client.stats()['hedges'] == 1
+
+
+def test_burst_of_slow_calls_does_not_starve_later_calls():
+    model = FakeGenerativeModel(latency=3.0)
+    client = make_client(model, timeout=0.2, max_attempts=1, rate_limit=1000, burst=100, max_workers=16)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=40) as callers:
+        futures = [callers.submit(client.generate_content, ['prompt']) for _ in range(40)]
+        for future in futures:
+            with pytest.raises((GeminiTimeoutError, FakeAPIError)):
+                future.result()
+    # The SDK timeout ends each call at its caller's deadline instead of holding a worker for 3s
+    assert time.monotonic() - started < 1.0
+
+    # Calls left in the queue are dropped, not sent to the model after their callers got an error
+    reached = model.calls
+    time.sleep(0.3)
+    assert model.calls == reached
+
+    model.latency = 0.0
+    started = time.monotonic()
+    assert client.generate_content(['prompt']).text == model.text
+    assert time.monotonic() - started < 0.2
@@ -0,0 +1,126 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from analysis_cache import AnalysisCache
+from image_fingerprint import FingerprintIndex, compute_dhash, hamming_distance
+
+
+def flip_bits(fingerprint, count, rng):
+    for bit in rng.sample(range(64), count):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def brute_force(entries, fingerprint, max_distance):
+    return sorted(
+        (hamming_distance(fingerprint, candidate), file_hash)
+        for file_hash, candidate in entries.items()
+        if hamming_distance(fingerprint, candidate) <= max_distance
+    )
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(7)
+    index = FingerprintIndex()
+    entries = {}
+    # Random fingerprints plus clusters of near-duplicates at every distance the index supports
+    bases = [rng.getrandbits(64) for _ in range(200)]
+    for number in range(5000):
+        if number % 2:
+            fingerprint = flip_bits(rng.choice(bases), rng.randint(0, 12), rng)
+        else:
+            fingerprint = rng.getrandbits(64)
+        entries[f"h{number}"] = fingerprint
+        index.add(f"h{number}", fingerprint)
+
+    queries = [flip_bits(rng.choice(bases), rng.randint(0, 6), rng) for _ in range(100)]
+    queries += [rng.getrandbits(64) for _ in range(20)]
+    for max_distance in range(index.max_supported_distance + 1):
+        for query in queries:
+            assert index.nearest(query, max_distance) == brute_force(entries, query, max_distance)
+
+
+def test_distance_beyond_the_chunk_guarantee_is_refused():
+    index = FingerprintIndex()
+    with pytest.raises(ValueError):
+        index.nearest(0, index.max_supported_distance + 1)
+
+
+def test_remove_and_fingerprint_of():
+    index = FingerprintIndex()
+    index.add('a', 0b1011)
+    index.add('b', 0b1011)
+    index.add('c', 0b1010)
+
+    assert index.fingerprint_of('a') == 0b1011
+    assert index.fingerprint_of('missing') is None
+
+    index.remove(['a', 'c', 'missing'])
+    assert index.fingerprint_of('a') is None
+    assert index.nearest(0b1011, 2) == [(0, 'b')]
+    assert len(index) == 1
+
+    # Emptied buckets are dropped, not left behind
+    index.remove(['b'])
+    assert len(index) == 0
+    assert all(not table for table in index._tables)
+
+
+def test_re_adding_a_hash_moves_it():
+    index = FingerprintIndex()
+    index.add('a', 0)
+    index.add('a', 0xFFFF)
+
+    assert index.nearest(0, 3) == []
+    assert index.nearest(0xFFFF, 0) == [(0, 'a')]
+    assert len(index) == 1
+
+
+def test_reload_from_sqlite(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite3')
+    index = FingerprintIndex(db_path=db_path)
+    index.add('a', 1)
+    index.add('b', 2 ** 63 + 5)
+    index.add('c', 3)
+    index.remove(['c'])
+
+    reloaded = FingerprintIndex(db_path=db_path)
+    assert len(reloaded) == 2
+    assert reloaded.fingerprint_of('b') == 2 ** 63 + 5
+    assert reloaded.fingerprint_of('c') is None
+    assert reloaded.nearest(1, 0) == [(0, 'a')]
+
+
+def test_cache_removals_prune_the_index(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite3')
+    index = FingerprintIndex(db_path=db_path)
+    cache = AnalysisCache(db_path=db_path, disk_max_entries=2, on_remove=index.remove)
+    for number in range(4):
+        cache.set(f"h{number}", {'product_name': 'Kupa'})
+        index.add(f"h{number}", number)
+
+    cache.disk.prune()
+    assert sorted(index._fingerprints) == ['h2', 'h3']
+
+    cache.invalidate('h3')
+    assert index.fingerprint_of('h3') is None
+    assert len(FingerprintIndex(db_path=db_path)) == 1
+
+
+def test_resized_copy_is_a_near_duplicate():
+    rng = random.Random(3)
+    image = Image.new('RGB', (640, 480), 'white')
+    draw = ImageDraw.Draw(image)
+    for _ in range(25):
+        x, y = rng.randint(0, 560), rng.randint(0, 400)
+        draw.ellipse([x, y, x + rng.randint(20, 160), y + rng.randint(20, 160)],
+                     fill=tuple(rng.randint(0, 255) for _ in range(3)))
+
+    original, copy = io.BytesIO(), io.BytesIO()
+    image.save(original, 'PNG')
+    image.resize((320, 240)).save(copy, 'JPEG', quality=60)
+
+    assert hamming_distance(compute_dhash(original.getvalue()), compute_dhash(copy.getvalue())) <= 6
@@ -0,0 +1,34 @@
+import decimal
+from dataclasses import dataclass
+
+import pytest
+from flask import Flask
+from markupsafe import Markup
+
+from json_provider import OrjsonProvider, create_json_provider
+
+pytest.importorskip('orjson')
+
+
+@dataclass
+class Listing:
+    title: str
+    price: decimal.Decimal
+
+
+def test_types_orjson_does_not_know_use_the_flask_default():
+    provider = create_json_provider(Flask(__name__))
+    assert isinstance(provider, OrjsonProvider)
+
+    text = provider.dumps({
+        'price': decimal.Decimal('12.50'),
+        'html': Markup('<b>x</b>'),
+        1: Listing('Kupa', decimal.Decimal('3'))
+    })
+    assert provider.loads(text) == {'price': '12.50', 'html': '<b>x</b>', '1': {'title': 'Kupa', 'price': '3'}}
+
+
+def test_unknown_types_still_raise():
+    provider = create_json_provider(Flask(__name__))
+    with pytest.raises(TypeError):
+        provider.dumps({'value': object()})
@@ -0,0 +1,107 @@
+import os
+import time
+
+import pytest
+
+from marketplace_probe import MarketplaceProber, RegexAdapter, normalize_query
+from marketplace_standin import MarketplaceStandIn
+from marketplaces import MarketplaceRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPECTED_COUNTS = {
+    'trendyol_search': 1284,
+    'hepsiburada_search': 532,
+    'n11_search': 87,
+    'amazon_tr_search': 3000,
+    'ciceksepeti_search': 0,
+    'vatanbilgisayar_search': 1284,
+    'teknosa_search': 41,
+    'media_markt_search': 19,
+    'dolap_search': 6,
+}
+
+
+@pytest.fixture
+def registry():
+    return MarketplaceRegistry(os.path.join(ROOT, 'marketplaces.json'), os.path.join(ROOT, 'marketplace_logos'))
+
+
+def make_prober(registry, standin, **kwargs):
+    return MarketplaceProber(registry, base_url=standin.base_url, **kwargs)
+
+
+def test_counts_are_parsed_from_every_probed_marketplace(registry):
+    with MarketplaceStandIn() as standin:
+        prober = make_prober(registry, standin)
+        results = prober.probe('Kahve Kupası', registry.encode_query('Kahve Kupası'))
+
+    assert {marketplace_id: result.count for marketplace_id, result in results.items()} == EXPECTED_COUNTS
+    # Requests keep the marketplace's own path and query under its id
+    assert ('trendyol_search', '/sr?q=Kahve Kupası') in standin.requests
+    assert ('vatanbilgisayar_search', '/arama/Kahve Kupası/') in standin.requests
+
+
+def test_unknown_layout_is_not_a_zero_count(registry):
+    pages = {'trendyol_search': '<html>Yeni sayfa düzeni</html>'}
+    with MarketplaceStandIn(pages=pages) as standin:
+        results = make_prober(registry, standin).probe('kupa', 'kupa')
+
+    assert results['trendyol_search'].count is None
+    # Marketplaces the stand-in answers with 404 are failures, not empty results
+    assert results['hepsiburada_search'].count is None
+
+
+def test_listings_are_extracted_and_resolved(registry):
+    marketplace = registry.by_id['trendyol_search']
+    adapter = RegexAdapter(
+        marketplace, None, 1.0, r'"totalCount":(\d+)',
+        listing_pattern=r'<a href="(?P<url>[^"]+)">(?P<title>[^<]+)</a>', max_listings=2
+    )
+    result = adapter.parse(
+        '{"totalCount":3}<a href="/kupa-1">Kupa &amp; Tabak</a><a href="/kupa-2">Kupa 2</a><a href="/kupa-3">Kupa 3</a>'
+    )
+
+    assert result.count == 3
+    assert result.listings == [
+        {'title': 'Kupa & Tabak', 'url': 'https://www.trendyol.com/kupa-1'},
+        {'title': 'Kupa 2', 'url': 'https://www.trendyol.com/kupa-2'},
+    ]
+
+
+def test_slow_marketplace_does_not_hold_back_the_others(registry):
+    with MarketplaceStandIn(delays={'trendyol_search': 1.0}) as standin:
+        prober = make_prober(registry, standin, default_timeout=0.2)
+        started = time.monotonic()
+        results = prober.probe('kupa', 'kupa')
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 0.8
+    assert results['trendyol_search'].count is None
+    assert results['hepsiburada_search'].count == 532
+    stats = prober.stats()
+    assert stats['failures'] + stats['timeouts'] == 1
+
+
+def test_turkish_casefold_shares_the_cache_key(registry):
+    assert normalize_query('KIRMIZI  İpek Eşarp') == 'kırmızı ipek eşarp'
+
+    with MarketplaceStandIn() as standin:
+        prober = make_prober(registry, standin)
+        prober.probe('KIRMIZI İpek Eşarp', registry.encode_query('KIRMIZI İpek Eşarp'))
+        fetched = len(standin.requests)
+        prober.probe('kırmızı ipek  eşarp', registry.encode_query('kırmızı ipek  eşarp'))
+
+    assert len(standin.requests) == fetched
+    assert prober.stats()['cache_hits'] == len(prober.adapters)
+
+
+def test_background_probe_finishes_within_the_deadline(registry):
+    with MarketplaceStandIn(delays={'trendyol_search': 1.0}) as standin:
+        prober = make_prober(registry, standin, default_timeout=0.2)
+        future = prober.probe_in_background('kupa', 'kupa')
+        results = future.result(timeout=prober.deadline + 0.5)
+
+    assert prober.deadline == 0.2
+    assert results['trendyol_search'].count is None
+    assert results['n11_search'].count == 87
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def parse(image_search_app):
+    return image_search_app.parse_product_info
+
+
+def test_schema_output_is_used_as_is(parse):
+    assert parse('{"product_name": "Kupa", "brand": "X"}') == {'product_name': 'Kupa', 'brand': 'X'}
+
+
+def test_fenced_output_is_used_as_is(parse):
+    assert parse('```json\n{"product_name": "Kupa"}\n```') == {'product_name': 'Kupa'}
+    assert parse('```json {"product_name": "Kupa"}```') == {'product_name': 'Kupa'}
+
+
+def test_truncated_output_is_salvaged(image_search_app, parse):
+    product_info = parse('{"product_name": "Kahve Kupası", "brand": "X", "color": "kır')
+
+    assert product_info['product_name'] == 'Kahve Kupası'
+    assert product_info['brand'] == 'X'
+    assert product_info['color'] == image_search_app.fallback_product_info()['color']
+
+
+@pytest.mark.parametrize('text', [
+    '{"product_name": 5}',
+    '{"product_name": ""}',
+    '{"product_name": null, "brand": "X"}',
+    '{"product_name": {"tr": "Kupa"}}',
+    '{"product_name": 5, "brand": "X"',
+    '{"brand": "X"}',
+])
+def test_json_without_a_usable_name_falls_back(image_search_app, parse, text):
+    assert parse(text)['product_name'] == image_search_app.fallback_product_info()['product_name']
+
+
+def test_prose_is_scanned_for_a_name(parse):
+    assert parse('Ürün analizi\nproduct_name: Kahve Kupası\nbrand: X')['product_name'] == 'Kahve Kupası'
+
+
+def test_garbage_falls_back(image_search_app, parse):
+    assert parse('Üzgünüm, bu resmi analiz edemiyorum.') == image_search_app.fallback_product_info()
@@ -0,0 +1,126 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from search_jobs import QueueFullError, SearchJobManager
+
+
+class Blocker:
+    # A job function that runs until released, so tests control when jobs finish
+    def __init__(self, result='done'):
+        self.result = result
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.started.set()
+        assert self.release.wait(5)
+        return self.result
+
+
+def test_same_key_shares_the_in_flight_job():
+    manager = SearchJobManager(worker_count=2, max_queue=4)
+    blocker = Blocker(result={'product_name': 'Kupa'})
+
+    job, coalesced = manager.submit('a', blocker)
+    shared, shared_coalesced = manager.submit('a', Blocker())
+    other, other_coalesced = manager.submit('b', lambda: 'other')
+
+    assert not coalesced and shared_coalesced and not other_coalesced
+    assert shared is job
+    assert other is not job
+    assert manager.stats()['coalesced'] == 1
+
+    blocker.release.set()
+    assert job.wait(2)
+    assert job.status == 'completed'
+    assert job.to_dict()['result'] == {'product_name': 'Kupa'}
+
+    # Once the job is done the key starts a fresh one
+    again, again_coalesced = manager.submit('a', lambda: 'again')
+    assert again is not job and not again_coalesced
+
+
+def test_full_queue_is_rejected_with_a_retry_hint():
+    manager = SearchJobManager(worker_count=1, max_queue=1)
+    running = Blocker()
+    queued = Blocker()
+
+    manager.submit('running', running)
+    assert running.started.wait(2)
+    manager.submit('queued', queued)
+
+    with pytest.raises(QueueFullError) as raised:
+        manager.submit('rejected', Blocker())
+    # Two jobs ahead on one worker at the default 5s estimate
+    assert raised.value.retry_after == 10
+    assert manager.stats()['rejected'] == 1
+    assert manager.stats()['in_flight'] == 2
+
+    # A duplicate of a queued job is coalesced even while the queue is full
+    _, coalesced = manager.submit('queued', Blocker())
+    assert coalesced
+
+    running.release.set()
+    queued.release.set()
+
+
+def test_failed_job_reports_its_error_and_frees_the_key():
+    manager = SearchJobManager(worker_count=1)
+
+    def fail():
+        raise RuntimeError('Image analysis is temporarily unavailable, please retry later')
+
+    job, _ = manager.submit('a', fail)
+    assert job.wait(2)
+    assert job.to_dict()['error'] == 'Image analysis is temporarily unavailable, please retry later'
+    assert manager.stats()['in_flight'] == 0
+
+
+def test_finished_jobs_are_pruned_after_their_ttl():
+    manager = SearchJobManager(worker_count=2, job_ttl=0.1)
+    finished, _ = manager.submit('finished', lambda: 'done')
+    assert finished.wait(2)
+    blocker = Blocker()
+    running, _ = manager.submit('running', blocker)
+    assert blocker.started.wait(2)
+
+    time.sleep(0.15)
+    manager.submit('next', lambda: 'done')
+
+    assert manager.get(finished.id) is None
+    # Jobs still running are kept however old they are
+    assert manager.get(running.id) is running
+    blocker.release.set()
+
+
+def test_events_follow_the_job_versions():
+    manager = SearchJobManager(worker_count=1)
+    blocker = Blocker()
+    job, _ = manager.submit('a', blocker)
+    assert blocker.started.wait(2)
+
+    version = job.version
+    blocker.release.set()
+    assert job.wait_for_change(version, timeout=2) != version
+    assert job.wait(2)
+
+
+def test_endpoint_answers_429_with_retry_after(image_search_app, monkeypatch):
+    client = image_search_app.app.test_client()
+    image = io.BytesIO()
+    Image.effect_noise((300, 300), 60).convert('RGB').save(image, 'PNG')
+    image.seek(0)
+    filename = client.post('/api/upload', data={'image': (image, 'a.png')}).json['filename']
+
+    def full(key, fn):
+        raise QueueFullError(7)
+
+    monkeypatch.setattr(image_search_app.search_jobs, 'submit', full)
+    response = client.post('/api/search/jobs', json={'filename': filename})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
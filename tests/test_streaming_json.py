@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from streaming_json import IncrementalObjectParser, strip_code_fences
+
+PRODUCT = {
+    'product_name': 'Kahve "Ustası" \\ Kupa',
+    'product_type': 'mutfak',
+    'features': ['seramik', {'kapasite': '350 ml', 'ölçüler': [8, 10]}],
+    'brand': 'üü ’',
+    'color': '{kırmızı}, [mat]',
+    'price': 129.9,
+    'in_stock': True,
+    'discount': None,
+}
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalObjectParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return parser, completed
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+def test_chunk_boundaries_anywhere_give_the_same_fields(size):
+    # ensure_ascii puts \\uXXXX escapes in the text, so some chunks end inside an escape
+    text = json.dumps(PRODUCT, ensure_ascii=True, indent=2)
+    parser, completed = feed_in_chunks(text, size)
+
+    assert parser.complete
+    assert parser.fields == PRODUCT
+    assert [key for key, _ in completed] == list(PRODUCT)
+
+
+def test_field_is_reported_as_soon_as_it_is_complete():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"product_name": "Ku') == []
+    assert parser.feed('pa", "features": ["a", ') == [('product_name', 'Kupa')]
+    assert parser.feed('"b"]') == []
+    assert parser.feed('}') == [('features', ['a', 'b'])]
+
+
+@pytest.mark.parametrize('prefix', [
+    '```json\n',
+    'İşte analiz sonucu:\n\n```\n',
+    'Sure! Here is the JSON you asked for: ',
+])
+def test_prose_and_fences_before_the_brace_are_skipped(prefix):
+    parser, _ = feed_in_chunks(prefix + '{"product_name": "Kupa"}\n```\nUmarım yardımcı olur.', 4)
+
+    assert parser.complete
+    assert parser.fields == {'product_name': 'Kupa'}
+
+
+def test_truncated_input_keeps_only_complete_fields():
+    text = json.dumps(PRODUCT, ensure_ascii=False)
+    cut = text.index('"color"') + len('"color": "{kırm')
+    parser, _ = feed_in_chunks(text[:cut], 5)
+
+    assert not parser.complete
+    assert parser.fields == {key: PRODUCT[key] for key in ('product_name', 'product_type', 'features', 'brand')}
+
+
+def test_truncated_scalar_is_not_reported():
+    parser = IncrementalObjectParser()
+    parser.feed('{"product_name": "Kupa", "price": 12')
+
+    assert parser.fields == {'product_name': 'Kupa'}
+
+
+def test_nothing_after_the_closing_brace_is_parsed():
+    parser = IncrementalObjectParser()
+    parser.feed('{"a": 1} {"b": 2}')
+
+    assert parser.complete
+    assert parser.fields == {'a': 1}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"a": 1}', '{"a": 1}'),
+    ('```json\n{"a": 1}\n```', '{"a": 1}'),
+    ('```\n{"a": 1}\n```', '{"a": 1}'),
+    ('```json {"a": 1}```', '{"a": 1}'),
+    ('```{"a": 1}```', '{"a": 1}'),
+    ('  ```JSON\n[1, 2]\n```  ', '[1, 2]'),
+])
+def test_strip_code_fences(text, expected):
+    assert strip_code_fences(text) == expected
@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+from upload_lifecycle import UploadJanitor
+from upload_storage import UploadStorage
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return UploadStorage(str(tmp_path))
+
+
+def put(storage, name, size=1000, accessed=None, modified=None, directory=None):
+    # Writes a file into the original's shard and sets its times; returns its path
+    directory = directory or storage.shard_dir(name[:32])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as output:
+        output.write(b'x' * size)
+    now = time.time()
+    modified = now if modified is None else modified
+    os.utime(path, (modified if accessed is None else accessed, modified))
+    return path
+
+
+def file_hash(number):
+    return f"{number:032x}"
+
+
+def test_expired_uploads_go_with_their_thumbnails(storage):
+    now = time.time()
+    old = put(storage, f"{file_hash(1)}.jpg", accessed=now - 10 * DAY, modified=now - 10 * DAY)
+    old_thumbnail = put(storage, f"{file_hash(1)}.t256.jpg", accessed=now - 9 * DAY, modified=now - 9 * DAY)
+    fresh = put(storage, f"{file_hash(2)}.png", accessed=now - DAY, modified=now - 20 * DAY)
+
+    janitor = UploadJanitor(storage, max_age=7 * DAY, max_bytes=0)
+    janitor.sweep()
+
+    assert not os.path.exists(old)
+    assert not os.path.exists(old_thumbnail)
+    # A recent read keeps an old upload alive
+    assert os.path.exists(fresh)
+    stats = janitor.stats()
+    assert stats['expired'] == 1
+    assert stats['bytes_removed'] == 2000
+    assert stats['bytes'] == 1000
+
+
+def test_thumbnail_access_keeps_its_original(storage):
+    now = time.time()
+    original = put(storage, f"{file_hash(1)}.jpg", accessed=now - 10 * DAY, modified=now - 10 * DAY)
+    put(storage, f"{file_hash(1)}.t128.jpg", accessed=now - 60, modified=now - 10 * DAY)
+
+    UploadJanitor(storage, max_age=7 * DAY, max_bytes=0).sweep()
+
+    assert os.path.exists(original)
+
+
+def test_size_limit_evicts_least_recently_used_down_to_the_watermark(storage):
+    now = time.time()
+    # Written in one order, read in another: eviction follows atime
+    paths = {}
+    for number, accessed_hours_ago in ((1, 1), (2, 4), (3, 3), (4, 2)):
+        paths[number] = put(
+            storage, f"{file_hash(number)}.jpg",
+            accessed=now - accessed_hours_ago * 3600, modified=now - 5 * DAY + number
+        )
+    thumbnail = put(storage, f"{file_hash(2)}.t256.jpg", size=200, accessed=now - 5 * 3600, modified=now - DAY)
+
+    janitor = UploadJanitor(storage, max_age=0, max_bytes=3500, low_watermark=0.5)
+    janitor.sweep()
+
+    # 4200 bytes against a 1750 byte target: the three least recently read entries go
+    assert [number for number, path in paths.items() if os.path.exists(path)] == [1]
+    assert not os.path.exists(thumbnail)
+    stats = janitor.stats()
+    assert stats['evicted'] == 3
+    assert stats['bytes'] == 1000
+    assert stats['files'] == 1
+
+
+def test_nothing_is_evicted_under_the_size_limit(storage):
+    for number in range(3):
+        put(storage, f"{file_hash(number)}.jpg")
+
+    janitor = UploadJanitor(storage, max_age=0, max_bytes=3000)
+    janitor.sweep()
+
+    assert janitor.stats()['evicted'] == 0
+    assert janitor.stats()['bytes'] == 3000
+
+
+def test_stale_partial_files_are_removed(storage):
+    now = time.time()
+    directory = storage.shard_dir(file_hash(1))
+    stale_thumbnail = put(storage, 'tmpab12cd.part', accessed=now - 2 * 3600, modified=now - 2 * 3600,
+                          directory=directory)
+    fresh_thumbnail = put(storage, 'tmpef34gh.part', size=500, directory=directory)
+    stale_incoming = put(storage, 'tmp0001.part', modified=now - 2 * 3600, directory=storage.incoming_dir)
+    fresh_incoming = put(storage, 'tmp0002.part', directory=storage.incoming_dir)
+
+    janitor = UploadJanitor(storage, max_age=7 * DAY, max_bytes=10000, incoming_max_age=3600)
+    janitor.sweep()
+
+    assert not os.path.exists(stale_thumbnail)
+    assert not os.path.exists(stale_incoming)
+    assert os.path.exists(fresh_thumbnail)
+    assert os.path.exists(fresh_incoming)
+    # A thumbnail being written counts toward the size limit but is never evicted
+    assert janitor.stats()['bytes'] == 500
+
+
+def test_partial_files_count_toward_the_size_limit(storage):
+    now = time.time()
+    original = put(storage, f"{file_hash(1)}.jpg", accessed=now - 3600)
+    partial = put(storage, 'tmpab12cd.part', size=1500, directory=storage.shard_dir(file_hash(1)))
+
+    UploadJanitor(storage, max_age=0, max_bytes=2000, low_watermark=1.0).sweep()
+
+    assert not os.path.exists(original)
+    assert os.path.exists(partial)
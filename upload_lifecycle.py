@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import logging
+import tempfile
+import threading
+from collections import deque
+from PIL import Image, ImageOps
+from upload_storage import CONTENT_ADDRESSED_NAME
+
+# Thumbnails sit next to their original as <md5>.t<size>.<ext>
+VARIANT_NAME = re.compile(r'^([0-9a-f]{32})\.t(\d+)\.([a-z0-9]+)$')
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailCache:
+    def __init__(self, storage, sizes=(128, 256, 512), quality=80):
+        self.storage = storage
+        self.sizes = tuple(sorted(sizes))
+        self.quality = quality
+        # Striped locks keep a burst of requests for one image from rendering it several times
+        self._locks = [threading.Lock() for _ in range(64)]
+        self._stats_lock = threading.Lock()
+        self.stats_counters = {'hits': 0, 'renders': 0, 'failures': 0}
+
+    def path_for(self, original_path, file_hash, size, extension):
+        return os.path.join(os.path.dirname(original_path), f"{file_hash}.t{size}.{extension}")
+
+    def get(self, original_path, file_hash, size):
+        # Returns (path, mimetype); None when the original cannot be decoded
+        for extension, mimetype in (('jpg', 'image/jpeg'), ('webp', 'image/webp')):
+            path = self.path_for(original_path, file_hash, size, extension)
+            if os.path.isfile(path):
+                self._count('hits')
+                return path, mimetype
+
+        with self._locks[int(file_hash[:8], 16) % len(self._locks)]:
+            for extension, mimetype in (('jpg', 'image/jpeg'), ('webp', 'image/webp')):
+                path = self.path_for(original_path, file_hash, size, extension)
+                if os.path.isfile(path):
+                    self._count('hits')
+                    return path, mimetype
+
+            try:
+                result = self._render(original_path, file_hash, size)
+            except Exception as e:
+                logger.warning(f"Could not render {size}px thumbnail of {file_hash}: {str(e)}")
+                self._count('failures')
+                return None
+            self._count('renders')
+            return result
+
+    def _render(self, original_path, file_hash, size):
+        with Image.open(original_path) as image:
+            if image.format == 'JPEG':
+                image.draft('RGB', (size, size))
+            if getattr(image, 'is_animated', False):
+                image.seek(0)
+
+            frame = ImageOps.exif_transpose(image)
+            has_alpha = frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info
+            frame = frame.convert('RGBA' if has_alpha else 'RGB')
+            frame.thumbnail((size, size), Image.LANCZOS)
+
+            extension, mimetype = ('webp', 'image/webp') if has_alpha else ('jpg', 'image/jpeg')
+            path = self.path_for(original_path, file_hash, size, extension)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as output:
+                    if has_alpha:
+                        frame.save(output, format='WEBP', quality=self.quality, method=4)
+                    else:
+                        frame.save(output, format='JPEG', quality=self.quality, optimize=True, progressive=True)
+                # Readers only ever see a complete thumbnail
+                os.replace(temp_path, path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
+        return path, mimetype
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.stats_counters, sizes=list(self.sizes))
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats_counters[name] += 1
+
+
+class UploadJanitor:
+    # Last access is tracked in atime, set explicitly by UploadStorage.touch, so it works on
+    # noatime mounts and is shared by every worker process using the same folder.
+    def __init__(self, storage, max_age=7 * 24 * 3600, max_bytes=2 * 1024 ** 3, interval=300,
+                 low_watermark=0.9, incoming_max_age=3600):
+        self.storage = storage
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.low_watermark = low_watermark
+        self.incoming_max_age = incoming_max_age
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            'runs': 0, 'files': 0, 'bytes': 0,
+            'expired': 0, 'evicted': 0, 'bytes_removed': 0, 'last_run_seconds': None,
+        }
+
+    def start(self):
+        if self._thread is None and (self.max_age or self.max_bytes):
+            self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Upload janitor sweep failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def sweep(self):
+        started_at = time.monotonic()
+        now = time.time()
+        self._remove_stale_incoming(now)
+
+        # An original and its thumbnails form one entry, evicted together
+        entries = {}
+        partial_bytes = stale_bytes = 0
+        for path, name, stat in self._scan():
+            if name.endswith('.part'):
+                # Thumbnails being written; one left by a crashed worker goes like a stale upload
+                if stat.st_mtime < now - self.incoming_max_age:
+                    stale_bytes += self._remove({'paths': [path]})
+                else:
+                    partial_bytes += stat.st_size
+                continue
+            match = CONTENT_ADDRESSED_NAME.match(name) or VARIANT_NAME.match(name)
+            key = match.group(1) if match else path
+            entry = entries.setdefault(key, {'paths': [], 'bytes': 0, 'last_access': 0})
+            entry['paths'].append(path)
+            entry['bytes'] += stat.st_size
+            entry['last_access'] = max(entry['last_access'], stat.st_atime, stat.st_mtime)
+
+        total_bytes = partial_bytes + sum(entry['bytes'] for entry in entries.values())
+        expired = evicted = bytes_removed = 0
+        ordered = deque(sorted(entries.values(), key=lambda entry: entry['last_access']))
+
+        if self.max_age:
+            cutoff = now - self.max_age
+            while ordered and ordered[0]['last_access'] < cutoff:
+                bytes_removed += self._remove(ordered.popleft())
+                expired += 1
+
+        if self.max_bytes and total_bytes - bytes_removed > self.max_bytes:
+            # Evict down to a low watermark so the next few uploads do not trigger another pass
+            target = self.max_bytes * self.low_watermark
+            while ordered and total_bytes - bytes_removed > target:
+                bytes_removed += self._remove(ordered.popleft())
+                evicted += 1
+
+        with self._lock:
+            self.stats_counters['runs'] += 1
+            self.stats_counters['files'] = sum(len(entry['paths']) for entry in ordered)
+            self.stats_counters['bytes'] = total_bytes - bytes_removed
+            self.stats_counters['expired'] += expired
+            self.stats_counters['evicted'] += evicted
+            self.stats_counters['bytes_removed'] += bytes_removed + stale_bytes
+            self.stats_counters['last_run_seconds'] = round(time.monotonic() - started_at, 3)
+
+        if expired or evicted:
+            logger.info(f"Upload janitor removed {expired} expired and {evicted} evicted uploads ({bytes_removed} bytes)")
+
+    def _scan(self):
+        stack = [self.storage.root]
+        while stack:
+            try:
+                iterator = os.scandir(stack.pop())
+            except FileNotFoundError:
+                continue
+            with iterator:
+                for entry in iterator:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.name, entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+
+    def _remove(self, entry):
+        removed = 0
+        for path in entry['paths']:
+            try:
+                size = os.stat(path).st_size
+                os.unlink(path)
+                removed += size
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def _remove_stale_incoming(self, now):
+        # Uploads abandoned by a crashed worker never get committed or cleaned up by close()
+        try:
+            iterator = os.scandir(self.storage.incoming_dir)
+        except FileNotFoundError:
+            return
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.stat().st_mtime < now - self.incoming_max_age:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+
+    def stats(self):
+        with self._lock:
+            return dict(self.stats_counters, max_age=self.max_age, max_bytes=self.max_bytes)
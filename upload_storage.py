@@ -0,0 +1,211 @@
+import os
+import re
+import time
+import hashlib
+import tempfile
+from stat import S_ISREG
+from collections import namedtuple
+from flask import Request
+from PIL import ImageFile
+from werkzeug.utils import secure_filename
+from image_preprocessing import sniff_mime_type
+
+StoredUpload = namedtuple('StoredUpload', [
+    'filename', 'file_hash', 'path', 'size', 'mime_type', 'width', 'height', 'duplicate'
+])
+
+MIME_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{32})\.([a-z0-9]+)$')
+
+
+class IncomingUpload:
+    # Sniffing stops after this many bytes; headers with large EXIF blocks still fit
+    SNIFF_LIMIT = 256 * 1024
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.md5()
+        self._parser = ImageFile.Parser()
+        self.size = 0
+        self.header = b''
+        self.width = None
+        self.height = None
+        self.committed = False
+
+    @property
+    def file_hash(self):
+        return self._hash.hexdigest()
+
+    @property
+    def mime_type(self):
+        return sniff_mime_type(self.header)
+
+    def write(self, data):
+        self._file.write(data)
+        self._hash.update(data)
+
+        if len(self.header) < 32:
+            self.header += bytes(data[:32 - len(self.header)])
+        if self._parser is not None:
+            self._sniff_dimensions(data)
+
+        self.size += len(data)
+        return len(data)
+
+    def _sniff_dimensions(self, data):
+        try:
+            self._parser.feed(bytes(data))
+        except Exception:
+            self._parser = None
+            return
+
+        if self._parser.image is not None:
+            self.width, self.height = self._parser.image.size
+            self._parser = None
+        elif self.size + len(data) >= self.SNIFF_LIMIT:
+            self._parser = None
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        self._parser = None
+        if not self.committed and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class StreamingUploadRequest(Request):
+    upload_storage = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_storage is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return self.upload_storage.open_incoming()
+
+
+class UploadStorage:
+    def __init__(self, root, shard_levels=2, shard_width=2, chunk_size=1024 * 1024):
+        self.root = root
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+        self.chunk_size = chunk_size
+        self.incoming_dir = os.path.join(root, '.incoming')
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def request_class(self):
+        return type('ImageSearchRequest', (StreamingUploadRequest,), {'upload_storage': self})
+
+    def open_incoming(self):
+        return IncomingUpload(self.incoming_dir)
+
+    def receive(self, stream):
+        incoming = self.open_incoming()
+        try:
+            for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                incoming.write(chunk)
+        except Exception:
+            incoming.close()
+            raise
+        return incoming
+
+    def commit(self, incoming):
+        file_hash = incoming.file_hash
+        mime_type = incoming.mime_type
+        filename = f"{file_hash}.{MIME_EXTENSIONS[mime_type]}"
+        path = self.path_for(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        incoming.flush()
+        duplicate = False
+        try:
+            # Linking fails atomically if the same content is already stored
+            os.link(incoming.path, path)
+        except FileExistsError:
+            duplicate = True
+            self.touch(path)
+        except OSError:
+            os.replace(incoming.path, path)
+            incoming.committed = True
+        incoming.close()
+
+        return StoredUpload(filename, file_hash, path, incoming.size, mime_type,
+                            incoming.width, incoming.height, duplicate)
+
+    def shard_dir(self, file_hash):
+        parts = [
+            file_hash[level * self.shard_width:(level + 1) * self.shard_width]
+            for level in range(self.shard_levels)
+        ]
+        return os.path.join(self.root, *parts)
+
+    def path_for(self, filename):
+        match = CONTENT_ADDRESSED_NAME.match(filename)
+        if match:
+            return os.path.join(self.shard_dir(match.group(1)), filename)
+
+        # Uploads stored before content addressing live flat in the root
+        if not filename or secure_filename(filename) != filename:
+            return None
+        return os.path.join(self.root, filename)
+
+    def resolve(self, filename):
+        path = self.path_for(filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        self.touch(path, stat)
+        return path
+
+    def touch(self, path, stat=None, resolution=60):
+        # Records a read for the janitor's LRU. Only atime moves, so mtime keeps serving as
+        # Last-Modified; writes are skipped while the recorded access is still recent.
+        stat = stat or os.stat(path)
+        now = time.time()
+        if now - stat.st_atime > resolution:
+            try:
+                os.utime(path, (now, stat.st_mtime))
+            except OSError:
+                pass
+
+    def hash_for(self, filename):
+        match = CONTENT_ADDRESSED_NAME.match(filename)
+        return match.group(1) if match else None